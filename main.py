@@ -1,7 +1,9 @@
+import os
+
 from scripts.pipeline import singleton_pipeline
 
 if __name__ == '__main__':
-    docs_path = ".\\documents\\labor_law"
+    docs_path = os.path.join(".", "documents", "labor_law")
     singleton_pipeline.parse_documents(docs_path)
     singleton_pipeline.vectorize_documents()
 
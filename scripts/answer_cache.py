@@ -0,0 +1,129 @@
+import logging
+import math
+import threading
+import time
+from collections import OrderedDict
+
+# 配置日志
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+
+def cosine_similarity(a, b):
+    dot = 0.0
+    norm_a = 0.0
+    norm_b = 0.0
+    for x, y in zip(a, b):
+        dot += x * y
+        norm_a += x * x
+        norm_b += y * y
+    if norm_a == 0 or norm_b == 0:
+        return 0.0
+    return dot / math.sqrt(norm_a * norm_b)
+
+
+# 语义答案缓存：问题向量相似度超过阈值、且检索到的文本块 id 完全一致时，直接复用已生成的回答。
+# 不同数据集、不同模型的回答互不复用；整体按 LRU 淘汰，并支持 TTL 过期和按数据集失效。
+# generation_fn(collection) 返回数据集版本号（见 ParsedRecordManager.bump_generation），
+# 其他进程入库或删除文件后版本号变化，写入时版本号不同的缓存条目在查询时失效。
+class SemanticAnswerCache:
+
+    def __init__(self, similarity_threshold=0.95, max_entries=512, ttl_seconds=24 * 3600, generation_fn=None):
+        self.similarity_threshold = similarity_threshold
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.generation_fn = generation_fn
+        self._entries = OrderedDict()
+        self._next_key = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _collection_key(collection):
+        # 联合检索时 collection 为列表，按集合比较，与顺序无关
+        if isinstance(collection, str):
+            return frozenset([collection])
+        return frozenset(collection)
+
+    @staticmethod
+    def _chunk_key(chunk_ids):
+        return tuple(sorted(str(cid) for cid in chunk_ids))
+
+    def _generation(self, collection):
+        if self.generation_fn is None:
+            return None
+        return tuple(sorted((coll, self.generation_fn(coll)) for coll in collection))
+
+    def _expired(self, entry, now):
+        return self.ttl_seconds and now - entry['created_at'] > self.ttl_seconds
+
+    def lookup(self, collection, model, query_embedding, chunk_ids):
+        if query_embedding is None:
+            return None
+        collection = self._collection_key(collection)
+        chunk_key = self._chunk_key(chunk_ids)
+        generation = self._generation(collection)
+        now = time.time()
+        with self._lock:
+            best_key, best_score = None, self.similarity_threshold
+            for key, entry in list(self._entries.items()):
+                if self._expired(entry, now):
+                    del self._entries[key]
+                    continue
+                if entry['collection'] != collection:
+                    continue
+                if entry['generation'] != generation:
+                    # 数据集已被其他进程更新
+                    del self._entries[key]
+                    continue
+                if entry['model'] != model or entry['chunk_key'] != chunk_key:
+                    continue
+                score = cosine_similarity(query_embedding, entry['embedding'])
+                if score >= best_score:
+                    best_key, best_score = key, score
+            if best_key is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(best_key)
+            self.hits += 1
+            entry = self._entries[best_key]
+        logging.info(f"答案缓存命中: 相似度 {best_score:.4f}, 原问题: {entry['query']}")
+        return entry['answer']
+
+    def put(self, collection, model, query, query_embedding, chunk_ids, answer):
+        if query_embedding is None or not answer:
+            return
+        collection = self._collection_key(collection)
+        generation = self._generation(collection)
+        with self._lock:
+            self._entries[self._next_key] = {
+                'collection': collection,
+                'generation': generation,
+                'model': model,
+                'query': query,
+                'embedding': list(query_embedding),
+                'chunk_key': self._chunk_key(chunk_ids),
+                'answer': answer,
+                'created_at': time.time()
+            }
+            self._next_key += 1
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, collection=None):
+        with self._lock:
+            if collection is None:
+                removed = len(self._entries)
+                self._entries.clear()
+            else:
+                keys = [k for k, e in self._entries.items() if collection in e['collection']]
+                for k in keys:
+                    del self._entries[k]
+                removed = len(keys)
+        if removed:
+            logging.info(f"答案缓存失效: 数据集 {collection or '全部'}, 清除 {removed} 条")
+        return removed
+
+    def stats(self):
+        with self._lock:
+            return {'size': len(self._entries), 'hits': self.hits, 'misses': self.misses}
@@ -0,0 +1,169 @@
+import argparse
+import logging
+import time
+
+import numpy as np
+
+from dense_retriever import COARSE_DIM, NLIST, NPROBE, TwoStageDenseIndex
+
+# 配置日志
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+
+def _spectrum(dim, decay):
+    # decay > 0 时方差随维度递减（Matryoshka 式向量，前缀保留主要语义，对截断有利）；decay = 0 为各向同性，截断最不利
+    return (1.0 / np.arange(1, dim + 1, dtype=np.float32) ** decay).astype(np.float32)
+
+
+def synthetic_corpus(n, dim=1024, n_topics=64, decay=0.5, seed=0):
+    rng = np.random.default_rng(seed)
+    scale = _spectrum(dim, decay)
+    topics = rng.standard_normal((n_topics, dim)).astype(np.float32) * scale
+    assign = rng.integers(0, n_topics, size=n)
+    vectors = topics[assign] + 0.5 * rng.standard_normal((n, dim)).astype(np.float32) * scale
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def sample_queries(corpus, nq, noise=0.3, decay=0.5, seed=1):
+    # 在语料向量上加噪作为查询，模拟问题与条文语义相近但不完全相同
+    rng = np.random.default_rng(seed)
+    base = corpus[rng.integers(0, len(corpus), size=nq)]
+    queries = base + noise * rng.standard_normal(base.shape).astype(np.float32) * _spectrum(corpus.shape[1], decay)
+    return queries / np.linalg.norm(queries, axis=1, keepdims=True)
+
+
+def _latency_stats(latencies):
+    arr = np.asarray(latencies) * 1000
+    return arr.mean(), np.percentile(arr, 95)
+
+
+def _recall(flat_ids, two_ids, top_k):
+    flat_ids, two_ids = list(flat_ids), list(two_ids)
+    recall_count = len(set(flat_ids) & set(two_ids)) / max(len(flat_ids), 1)
+    recall_topk = len(set(flat_ids[:top_k]) & set(two_ids[:top_k])) / max(min(top_k, len(flat_ids)), 1)
+    return recall_count, recall_topk
+
+
+def _run(queries, flat_fn, two_fn, top_k):
+    flat_lat, two_lat, recall_count, recall_topk = [], [], [], []
+    for q in queries:
+        t0 = time.perf_counter()
+        flat_ids = flat_fn(q)
+        t1 = time.perf_counter()
+        two_ids = two_fn(q)
+        t2 = time.perf_counter()
+        flat_lat.append(t1 - t0)
+        two_lat.append(t2 - t1)
+        r_count, r_topk = _recall(flat_ids, two_ids, top_k)
+        recall_count.append(r_count)
+        recall_topk.append(r_topk)
+    return flat_lat, two_lat, np.mean(recall_count), np.mean(recall_topk)
+
+
+def bench_local(corpus, queries, count, top_k, coarse_dim, candidate_factor, nlist, nprobe):
+    # 本地 numpy 模拟，粗排与 Milvus 一样走 IVF（nlist=0 时为低维暴力检索）
+    index = TwoStageDenseIndex(corpus, coarse_dim=coarse_dim, candidate_factor=candidate_factor, nlist=nlist,
+                               nprobe=nprobe)
+    return _run(queries,
+                lambda q: index.flat_search(q, count)[0].tolist(),
+                lambda q: index.search(q, count)[0].tolist(),
+                top_k)
+
+
+def _wait_for_index(client, collection, timeout=600):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        # 建索引时未指定索引名，按字段查找
+        index_names = client.list_indexes(collection_name=collection, field_name="embedding_coarse")
+        if not index_names:
+            raise RuntimeError(f"{collection} 没有 embedding_coarse 字段的索引")
+        info = client.describe_index(collection_name=collection, index_name=index_names[0])
+        if not info.get('pending_index_rows'):
+            return
+        time.sleep(1)
+    logging.warning(f"{collection} 索引构建超时，结果可能包含未建索引的数据")
+
+
+def bench_milvus(vector, corpus, queries, count, top_k, batch_size=1000, keep=False):
+    # 将语料写入临时数据集（线上 schema 加上截断向量字段及其索引），对比 FLAT 与两阶段稠密检索
+    client = vector.milvus_client
+    collection = f"bench_dense_{len(corpus)}"
+    if client.has_collection(collection_name=collection):
+        client.drop_collection(collection_name=collection)
+    vector._create_collection(collection, coarse=True)
+    t0 = time.time()
+    for start in range(0, len(corpus), batch_size):
+        end = min(start + batch_size, len(corpus))
+        vector.upsert_entities(collection, [{
+            "id": i,
+            "embedding": corpus[i].tolist(),
+            "text_sparse": {0: 1.0},
+            "text": "",
+            "file_name": f"bench_{i % vector.num_partitions}",
+            "page_number": ""
+        } for i in range(start, end)])
+    client.flush(collection_name=collection)
+    _wait_for_index(client, collection)
+    logging.info(f"{collection} 写入并建索引完成: {len(corpus)} 条，耗时 {time.time() - t0:.2f} 秒")
+
+    def search(mode):
+        return lambda q: [hit['id'] for hit in vector._search_leg(collection, 'dense', q.tolist(), None, count, "",
+                                                                  30.0, dense_mode=mode)]
+
+    # 预热，避免首次查询的加载开销计入延迟
+    for q in queries[:5]:
+        search("flat")(q)
+        search("two_stage")(q)
+    try:
+        return _run(queries, search("flat"), search("two_stage"), top_k)
+    finally:
+        if not keep:
+            client.drop_collection(collection_name=collection)
+
+
+def print_row(label, flat_lat, two_lat, recall_count, recall_topk):
+    flat_mean, flat_p95 = _latency_stats(flat_lat)
+    two_mean, two_p95 = _latency_stats(two_lat)
+    print(f"{label:>10}{flat_mean:>12.2f}{flat_p95:>12.2f}{two_mean:>12.2f}{two_p95:>12.2f}"
+          f"{flat_mean / two_mean:>10.2f}x{recall_count:>12.4f}{recall_topk:>12.4f}")
+
+
+if __name__ == '__main__':
+    arg_parser = argparse.ArgumentParser(description="对比 FLAT 暴力检索与两阶段（截断向量粗排 + 完整向量精排）稠密检索")
+    arg_parser.add_argument('--sizes', default='10000,50000,200000', help="语料规模，逗号分隔")
+    arg_parser.add_argument('--snapshot', default=None, help="使用快照中的真实向量代替合成语料（按规模取前 N 条）")
+    arg_parser.add_argument('--milvus', action='store_true', help="在 Milvus 临时数据集上测试，否则为本地 numpy 模拟")
+    arg_parser.add_argument('--keep', action='store_true', help="测试后保留 Milvus 临时数据集")
+    arg_parser.add_argument('--decay', type=float, default=0.5,
+                            help="合成语料方差随维度衰减的指数，0 为各向同性（截断最不利）")
+    arg_parser.add_argument('--queries', type=int, default=200)
+    arg_parser.add_argument('--count', type=int, default=50, help="稠密召回数")
+    arg_parser.add_argument('--top-k', type=int, default=10)
+    arg_parser.add_argument('--coarse-dim', type=int, default=COARSE_DIM)
+    arg_parser.add_argument('--candidate-factor', type=int, default=4)
+    arg_parser.add_argument('--nlist', type=int, default=NLIST, help="本地模拟的 IVF 聚类数，0 表示粗排暴力检索")
+    arg_parser.add_argument('--nprobe', type=int, default=NPROBE)
+    args = arg_parser.parse_args()
+
+    sizes = [int(x) for x in args.sizes.split(',')]
+    source = None
+    if args.snapshot:
+        from snapshot import Snapshot
+        source = np.asarray(Snapshot(args.snapshot).dense, dtype=np.float32)
+        sizes = [size for size in sizes if size < len(source)] + [len(source)]
+    vector = None
+    if args.milvus:
+        from pipeline import singleton_pipeline
+        vector = singleton_pipeline.vector
+
+    print(f"{'size':>10}{'flat_ms':>12}{'flat_p95':>12}{'2stage_ms':>12}{'2stage_p95':>12}{'speedup':>11}"
+          f"{'recall@cnt':>12}{'recall@k':>12}")
+    for size in sizes:
+        corpus = source[:size] if source is not None else synthetic_corpus(size, decay=args.decay)
+        queries = sample_queries(corpus, args.queries, decay=args.decay)
+        if vector is not None:
+            row = bench_milvus(vector, corpus, queries, args.count, args.top_k, keep=args.keep)
+        else:
+            row = bench_local(corpus, queries, args.count, args.top_k, args.coarse_dim, args.candidate_factor,
+                              args.nlist, args.nprobe)
+        print_row(str(size), *row)
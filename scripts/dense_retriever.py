@@ -0,0 +1,93 @@
+import numpy as np
+
+from utils import l2_distances, topk_smallest
+
+# text-embedding-v4 的向量前缀可单独作为低维向量使用，截断后重新归一化即可
+COARSE_DIM = 256
+CANDIDATE_FACTOR = 4
+MIN_CANDIDATES = 100
+# 与 Milvus 中 embedding_coarse 的 IVF_FLAT 索引参数一致
+NLIST = 128
+NPROBE = 16
+
+
+def truncate_embeddings(vectors, dim=COARSE_DIM):
+    arr = np.asarray(vectors, dtype=np.float32)[..., :dim]
+    norms = np.linalg.norm(arr, axis=-1, keepdims=True)
+    return arr / np.maximum(norms, 1e-12)
+
+
+def num_candidates(count, candidate_factor=CANDIDATE_FACTOR):
+    return max(count * candidate_factor, MIN_CANDIDATES)
+
+
+def rescore_l2(query, candidate_vectors):
+    # 用完整维度向量对粗排候选重新计算 L2 距离
+    q = np.asarray(query, dtype=np.float32)
+    candidates = np.asarray(candidate_vectors, dtype=np.float32)
+    diff = candidates - q
+    return np.einsum('ij,ij->i', diff, diff)
+
+
+def train_ivf(vectors, nlist=NLIST, n_iter=10, max_train=50000, seed=0):
+    # 球面 k-means（内积度量），返回归一化的聚类中心及每个向量所属的列表
+    rng = np.random.default_rng(seed)
+    nlist = min(nlist, len(vectors))
+    train = vectors[rng.choice(len(vectors), size=min(len(vectors), max_train), replace=False)]
+    centroids = train[rng.choice(len(train), size=nlist, replace=False)]
+    for _ in range(n_iter):
+        assign = train.dot(centroids.T).argmax(axis=1)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assign, train)
+        empty = np.bincount(assign, minlength=nlist) == 0
+        # 空簇保留原中心
+        sums[empty] = centroids[empty]
+        centroids = sums / np.maximum(np.linalg.norm(sums, axis=1, keepdims=True), 1e-12)
+    assign = np.concatenate([chunk.dot(centroids.T).argmax(axis=1)
+                             for chunk in np.array_split(vectors, max(len(vectors) // 10000, 1))])
+    return centroids, assign
+
+
+# 两阶段稠密检索的本地实现：在截断的低维向量上粗排出较宽的候选集，再用完整向量精排。
+# nlist 不为空时粗排与 Milvus 一样走 IVF（只扫描最近的 nprobe 个聚类），否则为低维暴力检索。
+# 供 bench_dense.py 对比暴力检索的延迟和召回率。
+class TwoStageDenseIndex:
+
+    def __init__(self, dense, coarse_dim=COARSE_DIM, candidate_factor=CANDIDATE_FACTOR, nlist=NLIST,
+                 nprobe=NPROBE):
+        self.dense = np.asarray(dense, dtype=np.float32)
+        self.coarse_dim = coarse_dim
+        self.candidate_factor = candidate_factor
+        self.nprobe = nprobe
+        self.coarse = truncate_embeddings(self.dense, coarse_dim)
+        self._sq_norms = np.einsum('ij,ij->i', self.dense, self.dense)
+        self.centroids = None
+        if nlist:
+            self.centroids, assign = train_ivf(self.coarse, nlist)
+            # 按聚类排序后存储，每个倒排列表是连续的一段
+            order = np.argsort(assign, kind='stable')
+            self._list_ids = order
+            self._list_coarse = self.coarse[order]
+            self._list_offsets = np.concatenate([[0], np.cumsum(np.bincount(assign, minlength=len(self.centroids)))])
+
+    def flat_search(self, query, count):
+        distances = l2_distances(self.dense, self._sq_norms, query)
+        top = topk_smallest(distances, count)
+        return top, distances[top]
+
+    def _coarse_candidates(self, q_coarse, n):
+        # 归一化向量上 L2 与内积排序等价，粗排直接取内积最大的候选
+        if self.centroids is None:
+            return topk_smallest(-self.coarse.dot(q_coarse), n)
+        probes = topk_smallest(-self.centroids.dot(q_coarse), self.nprobe)
+        spans = [(self._list_offsets[c], self._list_offsets[c + 1]) for c in probes]
+        positions = np.concatenate([np.arange(start, end) for start, end in spans])
+        top = topk_smallest(-self._list_coarse[positions].dot(q_coarse), n)
+        return self._list_ids[positions[top]]
+
+    def search(self, query, count):
+        q_coarse = truncate_embeddings(query, self.coarse_dim)
+        candidates = self._coarse_candidates(q_coarse, num_candidates(count, self.candidate_factor))
+        distances = rescore_l2(query, self.dense[candidates])
+        top = topk_smallest(distances, count)
+        return candidates[top], distances[top]
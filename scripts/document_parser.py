@@ -2,6 +2,7 @@ import io
 import json
 import logging
 import os
+import threading
 import time
 import zipfile
 from typing import Union
@@ -13,10 +14,18 @@ logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(
 
 
 class ParsedRecordManager:
-    def __init__(self, output_dir, record_filename):
+    def __init__(self, output_dir, record_filename, generation_filename='collection_generations.json'):
         self.output_dir = output_dir
         self.record_file_path = os.path.join(output_dir, record_filename)
         self.records = self._load_records()
+        self._records_mtime = self._records_file_mtime()
+        # 后台入库服务会在多个线程中并发解析文件，记录的增删和落盘需要加锁
+        self._lock = threading.RLock()
+        # 数据集版本号：数据集内容变化（入库、删除、快照导入）时递增，
+        # 检索界面与入库服务等不同进程通过该文件判断答案缓存是否过期
+        self.generation_file_path = os.path.join(output_dir, generation_filename)
+        self._generations = {}
+        self._generations_mtime = None
 
     def _load_records(self):
         if os.path.exists(self.record_file_path):
@@ -28,6 +37,23 @@ class ParsedRecordManager:
                 return []
         return []
 
+    def _records_file_mtime(self):
+        try:
+            return os.path.getmtime(self.record_file_path)
+        except OSError:
+            return None
+
+    def reload_if_changed(self) -> bool:
+        # 检索界面只读解析记录，其他进程（如后台入库服务）写入记录文件后重新加载
+        with self._lock:
+            mtime = self._records_file_mtime()
+            if mtime is None or mtime == self._records_mtime:
+                return False
+            self.records = self._load_records()
+            self._records_mtime = mtime
+        logging.info(f"Reloaded parsed records from {self.record_file_path}")
+        return True
+
     def read_document(self, file_name: str)->Union[list, str, dict]:
         filepath = os.path.join(self.output_dir, file_name)
         if not os.path.exists(filepath):
@@ -53,13 +79,70 @@ class ParsedRecordManager:
 
     def save_records(self):
         os.makedirs(os.path.dirname(self.record_file_path), exist_ok=True)
-        with open(self.record_file_path, 'w', encoding='utf-8') as f:
-            json.dump(self.records, f, indent=4, ensure_ascii=False)
+        with self._lock:
+            # 每个文本块写入后都会保存断点，先写临时文件再原子替换，进程被杀时不会留下截断的记录文件
+            tmp_path = self.record_file_path + '.tmp'
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(self.records, f, indent=4, ensure_ascii=False)
+            os.replace(tmp_path, self.record_file_path)
+            self._records_mtime = self._records_file_mtime()
         logging.info(f"Saved parsed records to {self.record_file_path}")
 
     def add_record(self, record):
-        if self.find_record_idx(record) != 0:
-            self.records.append(record)
+        with self._lock:
+            if self.find_record_idx(record) != 0:
+                self.records.append(record)
+
+    def upsert_record(self, record):
+        with self._lock:
+            idx = self.find_record_idx(record)
+            if idx is None:
+                self.records.append(record)
+            else:
+                self.records[idx] = record
+
+    def find_records_by_source(self, file_name: str, collection: str = None) -> list:
+        return [r for r in self.records if r.get('original_filename') == file_name
+                and (collection is None or r.get('collection') == collection)]
+
+    def remove_record(self, record: dict):
+        with self._lock:
+            idx = self.find_record_idx(record)
+            if idx is not None:
+                del self.records[idx]
+
+    def _load_generations(self):
+        try:
+            mtime = os.path.getmtime(self.generation_file_path)
+        except OSError:
+            return {}
+        if mtime != self._generations_mtime:
+            try:
+                with open(self.generation_file_path, 'r', encoding='utf-8') as f:
+                    self._generations = json.load(f)
+                self._generations_mtime = mtime
+            except (OSError, json.JSONDecodeError) as e:
+                logging.error(f"Error reading {self.generation_file_path}: {e}")
+        return self._generations
+
+    def collection_generation(self, collection: str) -> int:
+        with self._lock:
+            return self._load_generations().get(collection, 0)
+
+    def bump_generation(self, collection: str) -> int:
+        with self._lock:
+            # 先重新读取文件，保留其他进程的更新
+            self._generations_mtime = None
+            generations = dict(self._load_generations())
+            generations[collection] = generations.get(collection, 0) + 1
+            os.makedirs(self.output_dir, exist_ok=True)
+            tmp_path = self.generation_file_path + '.tmp'
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(generations, f, indent=4, ensure_ascii=False)
+            os.replace(tmp_path, self.generation_file_path)
+            self._generations = generations
+            self._generations_mtime = os.path.getmtime(self.generation_file_path)
+            return generations[collection]
 
     def has_record(self, pdf_file: str) -> bool:
         return any(record.get('original_filename') == pdf_file for record in self.records)
@@ -79,6 +162,22 @@ class ParsedRecordManager:
         self.records[idx]['status'] = 'embed'
         self.save_records()
 
+    def record_checkpoint(self, record: dict) -> dict:
+        idx = self.find_record_idx(record)
+        return self.records[idx].get('checkpoint') or {}
+
+    def record_update_checkpoint(self, record: dict, content_md5: str, chunk_size: int,
+                                 chunk_overlap_percent: float, next_chunk: int):
+        # 文本块写入 Milvus 后记录断点，分块参数一致时中断后从 next_chunk 继续向量化
+        idx = self.find_record_idx(record)
+        self.records[idx]['checkpoint'] = {
+            'content_md5': content_md5,
+            'chunk_size': chunk_size,
+            'chunk_overlap_percent': chunk_overlap_percent,
+            'next_chunk': next_chunk
+        }
+        self.save_records()
+
 
 class MineruParser:
 
@@ -0,0 +1,258 @@
+import argparse
+import json
+import logging
+import os
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from utils import generate_file_md5
+
+# 配置日志
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+SUPPORTED_EXTENSIONS = ('.pdf', '.txt')
+
+
+# 后台入库服务：轮询 documents/<数据集>/ 目录，发现新增或变更的文件后去抖入队，
+# 批量解析（有界并发）并向量化，不阻塞检索进程。
+# 解析记录中未完成向量化的文件（含上次运行中断的）会按 retry_interval 定期重试向量化。
+class IngestionDaemon:
+
+    def __init__(self, pipeline, documents_root='./documents', poll_interval=2.0, debounce=5.0,
+                 batch_size=8, batch_wait=2.0, max_workers=2, status_file=None, retry_interval=60.0):
+        self.pipeline = pipeline
+        self.documents_root = documents_root
+        self.poll_interval = poll_interval
+        self.debounce = debounce
+        self.batch_size = batch_size
+        self.batch_wait = batch_wait
+        self.status_file = status_file
+        self.retry_interval = retry_interval
+        self.jobs = queue.Queue()
+        self._parse_executor = ThreadPoolExecutor(max_workers=max_workers)
+        self._stop = threading.Event()
+        self._threads = []
+        # path -> (mtime, size, 首次观察到该状态的时间)
+        self._observed = {}
+        # path -> (mtime, size)，已入队、尚未处理完的文件状态
+        self._queued = {}
+        # path -> (mtime, size)，已成功解析入库的文件状态
+        self._handled = {}
+        # path -> 时间戳，解析失败的文件在此之前不再重试
+        self._retry_after = {}
+        self._last_vectorize = 0.0
+        self._lock = threading.Lock()
+        self._status = {
+            'queue_depth': 0,
+            'in_progress': [],
+            'processed': 0,
+            'failed': 0,
+            'pending': 0,
+            'last_error': None,
+            'last_batch_at': None
+        }
+
+    def _scan(self):
+        # 目录结构为 documents/<数据集>/...，一级子目录名即数据集名
+        if not os.path.isdir(self.documents_root):
+            return []
+        found = []
+        for collection in sorted(os.listdir(self.documents_root)):
+            coll_dir = os.path.join(self.documents_root, collection)
+            if not os.path.isdir(coll_dir):
+                continue
+            for root, _, files in os.walk(coll_dir):
+                for file in files:
+                    if file.lower().endswith(SUPPORTED_EXTENSIONS):
+                        found.append((os.path.join(root, file), collection))
+        return found
+
+    def _is_parsed(self, path, collection):
+        # 解析记录中的 source_md5 与当前文件一致，说明已解析且内容未变；是否完成向量化由 _pending_records 跟踪
+        records = self.pipeline.record_manager.find_records_by_source(os.path.basename(path), collection)
+        if not records:
+            return False
+        source_md5 = records[0].get('source_md5')
+        return source_md5 is None or source_md5 == generate_file_md5(path)
+
+    def _pending_records(self):
+        return [r for r in self.pipeline.record_manager.records if r.get('status') != 'embed']
+
+    def _is_embedded(self, path, collection):
+        records = self.pipeline.record_manager.find_records_by_source(os.path.basename(path), collection)
+        return bool(records) and all(r.get('status') == 'embed' for r in records)
+
+    def _watch(self):
+        while not self._stop.is_set():
+            now = time.time()
+            for path, collection in self._scan():
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                state = (stat.st_mtime, stat.st_size)
+                if self._handled.get(path) == state or self._queued.get(path) == state:
+                    continue
+                if self._retry_after.get(path, 0) > now:
+                    continue
+                observed = self._observed.get(path)
+                if observed is None or observed[:2] != state:
+                    # 文件仍在写入或刚发生变化，重新开始去抖计时
+                    self._observed[path] = (state[0], state[1], now)
+                    continue
+                if now - observed[2] < self.debounce:
+                    continue
+                del self._observed[path]
+                if self._is_parsed(path, collection):
+                    self._handled[path] = state
+                    continue
+                self._queued[path] = state
+                self.jobs.put((path, collection, state))
+                logging.info(f"入库队列新增: {path} -> 数据集 {collection}")
+            self._update_status(queue_depth=self.jobs.qsize())
+            self._stop.wait(self.poll_interval)
+
+    def _next_batch(self):
+        try:
+            batch = [self.jobs.get(timeout=self.poll_interval)]
+        except queue.Empty:
+            return []
+        # 等待一小段时间凑批，批量文件只触发一次向量化
+        deadline = time.time() + self.batch_wait
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self.jobs.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _parse(self, path, collection):
+        # 先解析新版本，成功后再清理旧版本的解析记录，解析失败时旧数据仍可检索；
+        # 旧版本在 Milvus 中的文本块在新记录向量化开始时按文件名清理
+        file_name = os.path.basename(path)
+        old_records = self.pipeline.record_manager.find_records_by_source(file_name, collection)
+        if old_records:
+            logging.info(f"文件已变更，重新入库: {path}")
+        if not self.pipeline.parse_file(path, collection, force=bool(old_records)):
+            raise RuntimeError("解析失败")
+        if old_records:
+            self.pipeline.remove_records(old_records)
+
+    def _vectorize(self):
+        self._last_vectorize = time.time()
+        try:
+            self.pipeline.vectorize_documents()
+        except Exception as e:
+            self._update_status(last_error=f"vectorize: {e}")
+            logging.error(f"向量化失败: {e}")
+
+    def _retry_pending(self):
+        # 没有新文件时，定期重试解析记录中未完成向量化的文件（含服务重启前中断的）
+        pending = len(self._pending_records())
+        if not pending or time.time() - self._last_vectorize < self.retry_interval:
+            return
+        logging.info(f"重试向量化未完成的 {pending} 个解析记录")
+        self._vectorize()
+        remaining = len(self._pending_records())
+        with self._lock:
+            self._status['processed'] += max(pending - remaining, 0)
+        self._update_status(pending=remaining, last_batch_at=time.strftime('%Y-%m-%d %H:%M:%S'))
+
+    def _process(self):
+        while not self._stop.is_set():
+            batch = self._next_batch()
+            if not batch:
+                self._retry_pending()
+                continue
+            self._update_status(in_progress=[path for path, _, _ in batch], queue_depth=self.jobs.qsize())
+            futures = {self._parse_executor.submit(self._parse, path, coll): (path, coll, state)
+                       for path, coll, state in batch}
+            parsed, failed = [], 0
+            for future, (path, coll, state) in futures.items():
+                try:
+                    future.result()
+                    parsed.append((path, coll, state))
+                except Exception as e:
+                    failed += 1
+                    # 解析失败不标记为已处理，retry_interval 后重新入队
+                    self._retry_after[path] = time.time() + self.retry_interval
+                    self._update_status(last_error=f"{path}: {e}")
+                    logging.error(f"解析失败 {path}: {e}")
+                finally:
+                    self._queued.pop(path, None)
+            if parsed:
+                self._vectorize()
+
+            # 解析成功即标记为已处理；向量化中断或失败的文件计入 pending，由 _retry_pending 继续
+            processed = 0
+            for path, coll, state in parsed:
+                self._handled[path] = state
+                self._retry_after.pop(path, None)
+                if self._is_embedded(path, coll):
+                    processed += 1
+            with self._lock:
+                self._status['processed'] += processed
+                self._status['failed'] += failed
+            self._update_status(in_progress=[], queue_depth=self.jobs.qsize(), pending=len(self._pending_records()),
+                                last_batch_at=time.strftime('%Y-%m-%d %H:%M:%S'))
+            logging.info(f"入库批次完成: {len(batch)} 个文件，完成 {processed} 个，失败 {failed} 个，"
+                         f"待向量化 {len(parsed) - processed} 个，队列剩余 {self.jobs.qsize()} 个")
+
+    def _update_status(self, **kwargs):
+        with self._lock:
+            self._status.update(kwargs)
+            snapshot = dict(self._status)
+        if self.status_file:
+            os.makedirs(os.path.dirname(os.path.abspath(self.status_file)), exist_ok=True)
+            tmp_path = self.status_file + '.tmp'
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(snapshot, f, indent=4, ensure_ascii=False)
+            os.replace(tmp_path, self.status_file)
+
+    def status(self):
+        with self._lock:
+            return dict(self._status)
+
+    def start(self):
+        for target in (self._watch, self._process):
+            thread = threading.Thread(target=target, daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        logging.info(f"后台入库服务已启动，监听目录: {self.documents_root}")
+
+    def stop(self):
+        self._stop.set()
+        for thread in self._threads:
+            thread.join()
+        self._parse_executor.shutdown(wait=True)
+        logging.info("后台入库服务已停止")
+
+
+if __name__ == '__main__':
+    from pipeline import singleton_pipeline
+
+    arg_parser = argparse.ArgumentParser(description="后台入库服务：监听文档目录，自动解析并向量化新增或变更的文件")
+    arg_parser.add_argument('--documents', default=os.path.join('.', 'documents'))
+    arg_parser.add_argument('--poll-interval', type=float, default=2.0)
+    arg_parser.add_argument('--debounce', type=float, default=5.0, help="文件停止变化多少秒后才入队")
+    arg_parser.add_argument('--batch-size', type=int, default=8)
+    arg_parser.add_argument('--max-workers', type=int, default=2, help="并发解析的文件数")
+    arg_parser.add_argument('--retry-interval', type=float, default=60.0, help="解析失败或向量化未完成时的重试间隔（秒）")
+    arg_parser.add_argument('--status-file', default=os.path.join('.', 'parsed_documents', 'ingest_status.json'))
+    args = arg_parser.parse_args()
+
+    daemon = IngestionDaemon(singleton_pipeline, documents_root=args.documents, poll_interval=args.poll_interval,
+                             debounce=args.debounce, batch_size=args.batch_size, max_workers=args.max_workers,
+                             status_file=args.status_file, retry_interval=args.retry_interval)
+    daemon.start()
+    try:
+        while True:
+            time.sleep(60)
+            logging.info(f"入库状态: {daemon.status()}")
+    except KeyboardInterrupt:
+        daemon.stop()
@@ -0,0 +1,329 @@
+import argparse
+import itertools
+import json
+import logging
+import math
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from utils import generate_md5
+
+# 配置日志
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+SYNTHETIC_TOPICS = ["加班", "加班费", "试用期", "经济补偿", "解除劳动合同", "年休假", "工伤", "最低工资",
+                    "社会保险", "劳动争议仲裁", "女职工保护", "竞业限制", "工作时间", "病假工资"]
+SYNTHETIC_PATTERNS = ["{}是如何规定的", "关于{}有哪些法律规定", "{}的标准是什么", "用人单位在{}方面有哪些义务",
+                      "劳动者{}的权利如何保障", "{}发生纠纷应该怎么处理"]
+
+
+def load_queries(path):
+    # 支持两种查询日志：每行一个问题的纯文本，或每行 {"query": ..., "collection": ...} 的 jsonl
+    queries = []
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            if line.startswith('{'):
+                item = json.loads(line)
+                queries.append({'query': item['query'], 'collection': item.get('collection')})
+            else:
+                queries.append({'query': line, 'collection': None})
+    return queries
+
+
+def synthetic_queries(n, seed=0):
+    rng = random.Random(seed)
+    return [{'query': rng.choice(SYNTHETIC_PATTERNS).format(rng.choice(SYNTHETIC_TOPICS)), 'collection': None}
+            for _ in range(n)]
+
+
+def percentile(sorted_values, p):
+    if not sorted_values:
+        return 0.0
+    rank = max(int(math.ceil(p / 100.0 * len(sorted_values))) - 1, 0)
+    return sorted_values[rank]
+
+
+class PartialResultError(RuntimeError):
+    # 部分数据集检索超时或失败，检索结果不完整
+    pass
+
+
+class StageTimer:
+
+    def __init__(self):
+        self.timings = {}
+        # 抛出异常的阶段，用于按阶段统计错误
+        self.failed_stage = None
+
+    def stage(self, name):
+        timer = self
+
+        class _Stage:
+            def __enter__(self):
+                self.t0 = time.perf_counter()
+
+            def __exit__(self, exc_type, exc, tb):
+                timer.timings[name] = time.perf_counter() - self.t0
+                if exc_type is not None and timer.failed_stage is None:
+                    timer.failed_stage = name
+                return False
+
+        return _Stage()
+
+
+# 真实后端：DashScope 向量化 + Milvus 混合检索，可选调用 qwen agent 生成回答
+class PipelineBackend:
+
+    def __init__(self, pipeline, collection, count=50, top_k=10, with_agent=False, model="qwen-plus-latest",
+                 api_key="", adaptive=False, dense_mode="flat"):
+        self.pipeline = pipeline
+        self.adaptive = adaptive
+        self.dense_mode = dense_mode
+        self.collection = collection
+        self.count = count
+        self.top_k = top_k
+        self.with_agent = with_agent
+        self.model = model
+        self.api_key = api_key
+
+    def _run_agent(self, query, ref_docs):
+        # 与检索界面使用同一个助手构造函数，压测的提示词、重试和采样参数与线上一致
+        from rag_agent import build_rag_agent
+        bot = build_rag_agent(self.model, self.api_key, ref_docs)
+        response = None
+        for response in bot.run([{'role': 'user', 'content': query}]):
+            pass
+        return response
+
+    def run(self, item, timer):
+        collection = item.get('collection') or self.collection
+        with timer.stage('embed'):
+            query_embedding = self.pipeline.embed_query(item['query'])
+            if query_embedding[0] is None and query_embedding[1] is None:
+                raise RuntimeError("embedding failed")
+        with timer.stage('search'):
+            skipped = []
+            results = self.pipeline.search(collection, item['query'], query_embedding=query_embedding,
+                                           count=self.count, top_k=self.top_k, adaptive=self.adaptive,
+                                           dense_mode=self.dense_mode, skipped=skipped)
+            # 数据集超时被跳过时延迟被 collection_timeout 截断，不能算作成功请求
+            if skipped:
+                raise PartialResultError(f"skipped collections: {', '.join(skipped)}")
+        if self.with_agent:
+            with timer.stage('agent'):
+                self._run_agent(item['query'], self.pipeline.format_search_results(results))
+
+
+# 本地替身：快照 LocalIndex 检索，向量化和大模型生成用固定延迟模拟，不调用任何外部服务
+class LocalBackend:
+
+    def __init__(self, snapshot_dir, count=50, top_k=10, embed_latency_ms=0.0, agent_latency_ms=0.0):
+        from snapshot import LocalIndex
+        self.index = LocalIndex(snapshot_dir)
+        self.dim = self.index.dense.shape[1]
+        self.count = count
+        self.top_k = top_k
+        self.embed_latency_ms = embed_latency_ms
+        self.agent_latency_ms = agent_latency_ms
+
+    def _fake_embedding(self, query):
+        import numpy as np
+        # 以问题文本为种子生成稳定的伪向量，相同问题得到相同检索结果
+        rng = np.random.default_rng(int(generate_md5(query)[:8], 16))
+        dense = rng.standard_normal(self.dim).astype(np.float32)
+        dense /= np.linalg.norm(dense)
+        sparse = {int(i): 1.0 for i in rng.integers(0, 50000, size=8)}
+        return dense, sparse
+
+    def run(self, item, timer):
+        with timer.stage('embed'):
+            if self.embed_latency_ms:
+                time.sleep(self.embed_latency_ms / 1000.0)
+            dense, sparse = self._fake_embedding(item['query'])
+        with timer.stage('search'):
+            self.index.search(dense, sparse, count=self.count, top_k=self.top_k)
+        if self.agent_latency_ms:
+            with timer.stage('agent'):
+                time.sleep(self.agent_latency_ms / 1000.0)
+
+
+class LoadGenerator:
+
+    def __init__(self, backend, queries):
+        self.backend = backend
+        self.queries = queries
+        self._lock = threading.Lock()
+        self.samples = []
+
+    def _execute(self, item, scheduled_at):
+        timer = StageTimer()
+        error = None
+        try:
+            self.backend.run(item, timer)
+        except Exception as e:
+            error = f"{type(e).__name__}: {e}"
+        finished_at = time.perf_counter()
+        with self._lock:
+            # 总延迟从计划发出时刻算起，开环模式下包含排队时间，避免协调遗漏
+            self.samples.append({'total': finished_at - scheduled_at, 'stages': timer.timings, 'error': error,
+                                 'error_stage': (timer.failed_stage or 'other') if error else None,
+                                 'finished_at': finished_at})
+
+    def run_closed_loop(self, concurrency, requests=None, duration=None):
+        # 闭环：concurrency 个用户，每个用户收到上一次结果后立即发出下一次请求
+        source = itertools.cycle(self.queries)
+        source_lock = threading.Lock()
+        sent = [0]
+        deadline = time.perf_counter() + duration if duration else None
+
+        def next_item():
+            with source_lock:
+                if requests is not None and sent[0] >= requests:
+                    return None
+                if deadline is not None and time.perf_counter() >= deadline:
+                    return None
+                sent[0] += 1
+                return next(source)
+
+        def worker():
+            while True:
+                item = next_item()
+                if item is None:
+                    return
+                self._execute(item, time.perf_counter())
+
+        t0 = time.perf_counter()
+        threads = [threading.Thread(target=worker, daemon=True) for _ in range(concurrency)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        return time.perf_counter() - t0
+
+    def run_open_loop(self, rate, requests=None, duration=None, max_workers=256, poisson=True, seed=0):
+        # 开环：按到达率发出请求，不等待前一请求完成，模拟真实用户到达
+        rng = random.Random(seed)
+        source = itertools.cycle(self.queries)
+        t0 = time.perf_counter()
+        next_at = t0
+        sent = 0
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            while True:
+                if requests is not None and sent >= requests:
+                    break
+                if duration is not None and next_at - t0 >= duration:
+                    break
+                delay = next_at - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+                executor.submit(self._execute, next(source), next_at)
+                sent += 1
+                next_at += rng.expovariate(rate) if poisson else 1.0 / rate
+        return time.perf_counter() - t0
+
+    def report(self, elapsed):
+        ok = [s for s in self.samples if s['error'] is None]
+        errors = [s for s in self.samples if s['error'] is not None]
+        report = {
+            'requests': len(self.samples),
+            'errors': len(errors),
+            'error_rate': len(errors) / len(self.samples) if self.samples else 0.0,
+            'elapsed_s': elapsed,
+            'throughput_rps': len(ok) / elapsed if elapsed > 0 else 0.0,
+            'latency_ms': {}
+        }
+        stage_names = ['total'] + sorted({name for s in ok for name in s['stages']})
+        for name in stage_names:
+            values = sorted((s['total'] if name == 'total' else s['stages'].get(name)) for s in ok
+                            if name == 'total' or name in s['stages'])
+            if not values:
+                continue
+            report['latency_ms'][name] = {
+                'mean': sum(values) / len(values) * 1000,
+                'p50': percentile(values, 50) * 1000,
+                'p95': percentile(values, 95) * 1000,
+                'p99': percentile(values, 99) * 1000,
+                'max': values[-1] * 1000
+            }
+        error_types = {}
+        errors_by_stage = {}
+        for s in errors:
+            error_types[s['error']] = error_types.get(s['error'], 0) + 1
+            errors_by_stage[s['error_stage']] = errors_by_stage.get(s['error_stage'], 0) + 1
+        report['error_types'] = error_types
+        report['errors_by_stage'] = errors_by_stage
+        # 各阶段错误率：该阶段失败数 / 执行到该阶段的请求数
+        report['stage_error_rate'] = {}
+        for name, n in errors_by_stage.items():
+            attempts = sum(1 for s in self.samples if name in s['stages'])
+            report['stage_error_rate'][name] = n / attempts if attempts else 1.0
+        return report
+
+
+def format_report(report):
+    lines = [f"请求数: {report['requests']}, 错误数: {report['errors']} ({report['error_rate'] * 100:.2f}%), "
+             f"耗时: {report['elapsed_s']:.2f} 秒, 吞吐: {report['throughput_rps']:.2f} req/s",
+             f"{'stage':<10}{'mean':>10}{'p50':>10}{'p95':>10}{'p99':>10}{'max':>10}  (ms)"]
+    for name, stats in report['latency_ms'].items():
+        lines.append(f"{name:<10}{stats['mean']:>10.1f}{stats['p50']:>10.1f}{stats['p95']:>10.1f}"
+                     f"{stats['p99']:>10.1f}{stats['max']:>10.1f}")
+    for name, n in report['errors_by_stage'].items():
+        lines.append(f"阶段 {name} 错误 x{n} ({report['stage_error_rate'][name] * 100:.2f}%)")
+    for error, n in report['error_types'].items():
+        lines.append(f"错误 x{n}: {error}")
+    return "\n".join(lines)
+
+
+if __name__ == '__main__':
+    arg_parser = argparse.ArgumentParser(description="回放查询日志压测检索链路，输出吞吐和分阶段延迟")
+    arg_parser.add_argument('--queries', default=None, help="查询日志（txt 或 jsonl），不指定时使用合成查询")
+    arg_parser.add_argument('--synthetic', type=int, default=200, help="合成查询条数")
+    arg_parser.add_argument('--mode', choices=['closed', 'open'], default='closed')
+    arg_parser.add_argument('--concurrency', type=int, default=8, help="闭环模式并发用户数")
+    arg_parser.add_argument('--rate', type=float, default=10.0, help="开环模式到达率 (req/s)")
+    arg_parser.add_argument('--requests', type=int, default=None, help="总请求数")
+    arg_parser.add_argument('--duration', type=float, default=None, help="压测时长（秒）")
+    arg_parser.add_argument('--backend', choices=['pipeline', 'local'], default='pipeline')
+    arg_parser.add_argument('--collection', default='labor_law')
+    arg_parser.add_argument('--count', type=int, default=50)
+    arg_parser.add_argument('--top-k', type=int, default=10)
+    arg_parser.add_argument('--adaptive', action='store_true', help="pipeline 后端使用自适应召回")
+    arg_parser.add_argument('--dense-mode', choices=['flat', 'two_stage'], default='flat')
+    arg_parser.add_argument('--with-agent', action='store_true', help="pipeline 后端同时调用 qwen agent")
+    arg_parser.add_argument('--model', default='qwen-plus-latest')
+    arg_parser.add_argument('--api-key', default='')
+    arg_parser.add_argument('--snapshot', default=None, help="local 后端使用的快照目录")
+    arg_parser.add_argument('--embed-latency-ms', type=float, default=0.0, help="local 后端模拟向量化延迟")
+    arg_parser.add_argument('--agent-latency-ms', type=float, default=0.0, help="local 后端模拟生成延迟")
+    arg_parser.add_argument('--json', default=None, help="将报告写入 json 文件")
+    args = arg_parser.parse_args()
+
+    if args.requests is None and args.duration is None:
+        args.requests = 100
+    queries = load_queries(args.queries) if args.queries else synthetic_queries(args.synthetic)
+
+    if args.backend == 'local':
+        backend = LocalBackend(args.snapshot, count=args.count, top_k=args.top_k,
+                               embed_latency_ms=args.embed_latency_ms, agent_latency_ms=args.agent_latency_ms)
+    else:
+        from pipeline import singleton_pipeline
+        backend = PipelineBackend(singleton_pipeline, args.collection, count=args.count, top_k=args.top_k,
+                                  with_agent=args.with_agent, model=args.model, api_key=args.api_key,
+                                  adaptive=args.adaptive, dense_mode=args.dense_mode)
+
+    generator = LoadGenerator(backend, queries)
+    if args.mode == 'closed':
+        elapsed = generator.run_closed_loop(args.concurrency, requests=args.requests, duration=args.duration)
+    else:
+        elapsed = generator.run_open_loop(args.rate, requests=args.requests, duration=args.duration)
+
+    result = generator.report(elapsed)
+    print(format_report(result))
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(result, f, indent=4, ensure_ascii=False)
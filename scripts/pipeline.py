@@ -5,9 +5,11 @@ import shutil
 # 配置日志
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
+from answer_cache import SemanticAnswerCache
 from document_parser import ParsedRecordManager, MineruParser
+from snapshot import export_collection, import_snapshot, read_manifest
 from vector_processor import VectorProcessor
-from utils import get_dir_and_file_names, generate_uuid
+from utils import get_dir_and_file_names, generate_uuid, generate_file_md5
 
 
 class Pipeline:
@@ -17,13 +19,15 @@ class Pipeline:
         self.record_manager = ParsedRecordManager(output_dir=self.parsed_output_dir, record_filename=record_filename)
         self.mineru_parser = MineruParser(mineru_api_key)
         self.vector = VectorProcessor(dashscope_api_key=dashscope_api_key, record_manager=self.record_manager)
+        self.answer_cache = SemanticAnswerCache(generation_fn=self.record_manager.collection_generation)
         logging.info("pipeline初始化成功")
 
-    def _parse_single_document(self, file_path, collection_name):
+    def parse_file(self, file_path, collection_name, force=False):
+        # force: 文件已变更时重新解析，旧记录由调用方在解析成功后清理
         file_extension = os.path.splitext(file_path)[1].lower()
         file_name = os.path.basename(file_path)
 
-        if self.record_manager and self.record_manager.has_record(file_name):
+        if not force and self.record_manager and self.record_manager.has_record(file_name):
             logging.info(f"Skipping {file_path} as it's already parsed.")
             return False
 
@@ -37,7 +41,8 @@ class Pipeline:
                 record = {
                     "filename": new_file_name,
                     "original_filename": file_name,
-                    "collection": collection_name
+                    "collection": collection_name,
+                    "source_md5": generate_file_md5(file_path)
                 }
                 self.record_manager.add_record(record)
                 self.record_manager.save_records()
@@ -56,7 +61,8 @@ class Pipeline:
                         record = {
                             "filename": json_file,
                             "original_filename": src_file,
-                            "collection": collection_name
+                            "collection": collection_name,
+                            "source_md5": generate_file_md5(file_path)
                         }
                         self.record_manager.add_record(record)
                     self.record_manager.save_records()
@@ -75,7 +81,7 @@ class Pipeline:
 
         processed_count = 0
         for file_path in files:
-            if self._parse_single_document(file_path, dir_name):
+            if self.parse_file(file_path, dir_name):
                 processed_count += 1
 
         if processed_count > 0:
@@ -86,7 +92,7 @@ class Pipeline:
     def parse_documents(self, path):
         if os.path.isfile(path):
             dir_name = os.path.basename(os.path.dirname(path))
-            self._parse_single_document(path, dir_name)
+            self.parse_file(path, dir_name)
             return self.record_manager.records if self.record_manager else []
         elif os.path.isdir(path):
             return self.parse_documents_in_directory(path)
@@ -104,10 +110,53 @@ class Pipeline:
         return ""
 
     def vectorize_documents(self):
-        return self.vector.vectorize_parsed_documents()
-
-    def search(self, coll, query, **kwargs):
-        return self.vector.search_hybrid(coll, query, **kwargs)
+        results = self.vector.vectorize_parsed_documents()
+        for coll in {r['collection'] for r in results}:
+            self._collection_changed(coll)
+        return results
+
+    def _collection_changed(self, coll):
+        # 递增数据集版本号，其他进程（检索界面、入库服务）的答案缓存据此失效
+        self.record_manager.bump_generation(coll)
+        self.answer_cache.invalidate(coll)
+
+    def list_files(self, coll):
+        # 后台入库服务新增的文件无需重启界面即可出现在文件筛选中
+        self.record_manager.reload_if_changed()
+        colls = [coll] if isinstance(coll, str) else list(coll)
+        return [os.path.basename(r['original_filename']) for r in self.record_manager.records
+                if r.get('collection') in colls]
+
+    def delete_document(self, coll, file_name):
+        deleted = self.vector.delete_file_chunks(coll, file_name)
+        self._collection_changed(coll)
+        return deleted
+
+    def remove_document(self, coll, file_name):
+        # 删除文件的全部文本块及解析记录，文件变更后可重新解析入库
+        deleted = self.delete_document(coll, file_name)
+        self.remove_records(self.record_manager.find_records_by_source(file_name, coll))
+        return deleted
+
+    def remove_records(self, records):
+        for record in records:
+            self.record_manager.remove_record(record)
+        self.record_manager.save_records()
+
+    def export_snapshot(self, coll, out_dir):
+        return export_collection(self.vector, coll, out_dir)
+
+    def import_snapshot(self, snapshot_dir, coll=None):
+        coll = coll or read_manifest(snapshot_dir)['collection']
+        count = import_snapshot(self.vector, snapshot_dir, collection_name=coll)
+        self._collection_changed(coll)
+        return count
+
+    def embed_query(self, query):
+        return self.vector.emb_text(query, is_query=True)
+
+    def search(self, coll, query, file_names=None, **kwargs):
+        return self.vector.search_hybrid(coll, query, file_names=file_names, **kwargs)
 
 
 output_dir = './parsed_documents'
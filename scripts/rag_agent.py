@@ -0,0 +1,60 @@
+import logging
+
+from qwen_agent.agents import Assistant  # TODO 更换agent
+
+# 配置日志
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+
+# 检索界面（sreams.py）与压测工具（loadtest.py）共用的 RAG 助手，保证提示词和模型参数一致
+def build_rag_agent(model, api_key, ref_docs, use_web_search=False):
+    try:
+        if use_web_search:
+            use_web_prompt = "使用 Tavily MCP 搜索相关内容"
+        else:
+            use_web_prompt = "不使用 Tavily MCP 搜索相关内容"
+        # ====== 助手 system prompt 和函数描述 ======
+        system_prompt = """请充分理解以下参考资料内容，组织出满足用户提问的条理清晰的回复。
+{}
+
+# 参考资料：(文档的相关度作为参考的权重)
+{}""".format(use_web_prompt, ref_docs)
+        # TODO BUG
+        # functions_desc = [
+        #     {"mcpServers": {
+        #         "Tavily": {
+        #             "command": "npx",
+        #             "args": [
+        #                 "-y",
+        #                 "tavily-mcp@0.1.4"
+        #             ],
+        #             "env": {
+        #                 "TAVILY_API_KEY": st.session_state.travily_key
+        #             }
+        #         }
+        #     }}
+        # ]
+        functions_desc = []
+        llm_cfg = {
+            # 使用 DashScope 提供的模型服务
+            'model': model,
+            'model_server': 'dashscope',
+            'api_key': api_key,
+            'timeout': 30,
+            'retry_count': 3,
+            'generate_cfg': {
+                'top_p': 0.1
+            }
+        }
+        bot = Assistant(
+            llm=llm_cfg,
+            name='RAG检索助手',
+            description='用户提出问题，根据从知识库中检索的某个相关细节来回答。',
+            system_message=system_prompt,
+            function_list=functions_desc,
+        )
+        logging.info("创建助手成功")
+        return bot
+    except Exception as e:
+        logging.error(f"创建助手失败: {str(e)}")
+        raise
@@ -0,0 +1,291 @@
+import argparse
+import json
+import logging
+import os
+import shutil
+import time
+
+import numpy as np
+
+from utils import EMBEDDING_DIM, l2_distances, topk_smallest, rrf_fuse
+
+# 配置日志
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+SNAPSHOT_FORMAT_VERSION = 1
+MANIFEST_FILENAME = 'manifest.json'
+OUTPUT_FIELDS = ["id", "embedding", "text_sparse", "text", "file_name", "page_number"]
+METADATA_FIELDS = ["text", "file_name", "page_number"]
+
+# 快照目录结构（列式存储，向量可直接 mmap 加载）：
+#   manifest.json        数据集名、条数、维度、解析记录
+#   ids.npy              int64 主键
+#   dense.npy            float32 (N, dim) 稠密向量
+#   sparse_indptr.npy    int64 (N+1,) 稀疏向量 CSR 行偏移
+#   sparse_indices.npy   uint32 稀疏向量维度下标
+#   sparse_values.npy    float32 稀疏向量取值
+#   metadata.json        text / file_name / page_number 列
+
+
+def _sparse_items(sparse):
+    if not isinstance(sparse, dict):
+        raise ValueError(f"Unexpected sparse vector type: {type(sparse).__name__}")
+    return sorted((int(k), float(v)) for k, v in sparse.items())
+
+
+class _ArrayWriter:
+    # 按批追加写入原始数据，结束时补上 .npy 文件头；导出大数据集时不在内存中累积整个数组
+
+    def __init__(self, path, dtype):
+        self.path = path
+        self.dtype = np.dtype(dtype)
+        self.raw_path = path + '.raw'
+        self.rows = 0
+        self.row_shape = None
+        self._f = open(self.raw_path, 'wb')
+
+    def append(self, values):
+        arr = np.ascontiguousarray(values, dtype=self.dtype)
+        if self.row_shape is None:
+            self.row_shape = arr.shape[1:]
+        elif arr.shape[1:] != self.row_shape:
+            raise ValueError(f"Inconsistent row shape for {self.path}: {arr.shape[1:]} != {self.row_shape}")
+        self._f.write(arr.tobytes())
+        self.rows += len(arr)
+
+    def close(self):
+        self._f.close()
+        header = {
+            'descr': np.lib.format.dtype_to_descr(self.dtype),
+            'fortran_order': False,
+            'shape': (self.rows,) + tuple(self.row_shape or ())
+        }
+        with open(self.path, 'wb') as out, open(self.raw_path, 'rb') as raw:
+            np.lib.format.write_array_header_1_0(out, header)
+            shutil.copyfileobj(raw, out, 64 * 1024 * 1024)
+        os.remove(self.raw_path)
+
+    def abort(self):
+        self._f.close()
+        if os.path.exists(self.raw_path):
+            os.remove(self.raw_path)
+
+
+def export_collection(vector, collection_name, out_dir, batch_size=1000):
+    t0 = time.time()
+    client = vector.milvus_client
+    client.load_collection(collection_name=collection_name)
+    os.makedirs(out_dir, exist_ok=True)
+    writers = {name: _ArrayWriter(os.path.join(out_dir, f'{name}.npy'), dtype) for name, dtype in (
+        ('ids', np.int64), ('dense', np.float32), ('sparse_indptr', np.int64),
+        ('sparse_indices', np.uint32), ('sparse_values', np.float32))}
+    metadata = {field: [] for field in METADATA_FIELDS}
+    writers['sparse_indptr'].append([0])
+    nnz = 0
+    iterator = client.query_iterator(collection_name=collection_name, batch_size=batch_size,
+                                     filter="", output_fields=OUTPUT_FIELDS)
+    try:
+        try:
+            while True:
+                rows = iterator.next()
+                if not rows:
+                    break
+                indptr, indices, values = [], [], []
+                for row in rows:
+                    for idx, val in _sparse_items(row['text_sparse']):
+                        indices.append(idx)
+                        values.append(val)
+                    nnz += len(row['text_sparse'])
+                    indptr.append(nnz)
+                    for field in METADATA_FIELDS:
+                        metadata[field].append(row[field])
+                # 每批向量直接写入磁盘，内存中只保留当前批次
+                writers['ids'].append([row['id'] for row in rows])
+                writers['dense'].append([row['embedding'] for row in rows])
+                writers['sparse_indptr'].append(indptr)
+                writers['sparse_indices'].append(indices)
+                writers['sparse_values'].append(values)
+        finally:
+            iterator.close()
+    except BaseException:
+        for writer in writers.values():
+            writer.abort()
+        raise
+
+    count = writers['ids'].rows
+    if not count:
+        for writer in writers.values():
+            writer.abort()
+        logging.warning(f"数据集 {collection_name} 为空，未生成快照")
+        return None
+
+    for writer in writers.values():
+        writer.close()
+    with open(os.path.join(out_dir, 'metadata.json'), 'w', encoding='utf-8') as f:
+        json.dump(metadata, f, ensure_ascii=False)
+
+    records = []
+    if vector.record_manager:
+        records = [r for r in vector.record_manager.records if r.get('collection') == collection_name]
+    manifest = {
+        'format_version': SNAPSHOT_FORMAT_VERSION,
+        'collection': collection_name,
+        'count': count,
+        'dim': int(writers['dense'].row_shape[0]),
+        'created_at': time.strftime('%Y-%m-%d %H:%M:%S'),
+        'records': records
+    }
+    with open(os.path.join(out_dir, MANIFEST_FILENAME), 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=4, ensure_ascii=False)
+    logging.info(f"数据集 {collection_name} 导出快照完成: {count} 条，耗时 {time.time() - t0:.2f} 秒，目录 {out_dir}")
+    return manifest
+
+
+def read_manifest(snapshot_dir):
+    with open(os.path.join(snapshot_dir, MANIFEST_FILENAME), 'r', encoding='utf-8') as f:
+        manifest = json.load(f)
+    if manifest.get('format_version') != SNAPSHOT_FORMAT_VERSION:
+        raise ValueError(f"Unsupported snapshot format: {manifest.get('format_version')}")
+    return manifest
+
+
+class Snapshot:
+
+    def __init__(self, snapshot_dir, mmap=True):
+        self.snapshot_dir = snapshot_dir
+        self.manifest = read_manifest(snapshot_dir)
+        mmap_mode = 'r' if mmap else None
+        self.ids = self._load('ids.npy', mmap_mode)
+        self.dense = self._load('dense.npy', mmap_mode)
+        self.sparse_indptr = self._load('sparse_indptr.npy', mmap_mode)
+        self.sparse_indices = self._load('sparse_indices.npy', mmap_mode)
+        self.sparse_values = self._load('sparse_values.npy', mmap_mode)
+        with open(os.path.join(snapshot_dir, 'metadata.json'), 'r', encoding='utf-8') as f:
+            self.metadata = json.load(f)
+
+    def _load(self, filename, mmap_mode):
+        return np.load(os.path.join(self.snapshot_dir, filename), mmap_mode=mmap_mode)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def sparse_row(self, i):
+        start, end = self.sparse_indptr[i], self.sparse_indptr[i + 1]
+        return {int(k): float(v) for k, v in zip(self.sparse_indices[start:end], self.sparse_values[start:end])}
+
+    def entity(self, i):
+        return {
+            "id": int(self.ids[i]),
+            "embedding": self.dense[i].tolist(),
+            "text_sparse": self.sparse_row(i),
+            "text": self.metadata['text'][i],
+            "file_name": self.metadata['file_name'][i],
+            "page_number": self.metadata['page_number'][i]
+        }
+
+
+def import_snapshot(vector, snapshot_dir, collection_name=None, batch_size=1000):
+    t0 = time.time()
+    snapshot = Snapshot(snapshot_dir)
+    collection_name = collection_name or snapshot.manifest['collection']
+    # 维度不一致时 Milvus 会在写入中途报错，提前检查，避免导入一半的数据集
+    if snapshot.manifest['dim'] != EMBEDDING_DIM or snapshot.dense.shape[1] != EMBEDDING_DIM:
+        raise ValueError(f"Snapshot dim {snapshot.manifest['dim']} does not match collection schema dim {EMBEDDING_DIM}")
+    vector._create_collection(collection_name)
+
+    for start in range(0, len(snapshot), batch_size):
+        end = min(start + batch_size, len(snapshot))
+        vector.upsert_entities(collection_name, [snapshot.entity(i) for i in range(start, end)])
+    logging.info(f"快照导入数据集 {collection_name}: {len(snapshot)} 条，耗时 {time.time() - t0:.2f} 秒")
+
+    # 同步解析记录，新节点不会再次解析、向量化这些文件
+    if vector.record_manager:
+        for record in snapshot.manifest.get('records', []):
+            record = dict(record, collection=collection_name)
+            vector.record_manager.upsert_record(record)
+        vector.record_manager.save_records()
+    return len(snapshot)
+
+
+# 基于快照的本地检索，返回格式与 VectorProcessor.search_hybrid 一致。
+# 稠密向量 L2 暴力检索、稀疏向量内积检索，再按 RRF 融合，适合无 Milvus 的节点或压测替身。
+class LocalIndex:
+
+    def __init__(self, snapshot_dir):
+        self.snapshot = Snapshot(snapshot_dir)
+        self.collection = self.snapshot.manifest['collection']
+        self.dense = np.asarray(self.snapshot.dense, dtype=np.float32)
+        self._sq_norms = np.einsum('ij,ij->i', self.dense, self.dense)
+        self._sparse_rows = np.repeat(np.arange(len(self.snapshot), dtype=np.int64),
+                                      np.diff(self.snapshot.sparse_indptr))
+        self._file_names = np.asarray(self.snapshot.metadata['file_name'])
+
+    def _mask(self, file_names):
+        if not file_names:
+            return None
+        if isinstance(file_names, str):
+            file_names = [file_names]
+        return np.isin(self._file_names, list(file_names))
+
+    def dense_scores(self, dense_embedding):
+        return l2_distances(self.dense, self._sq_norms, dense_embedding)
+
+    def sparse_scores(self, sparse_embedding):
+        if not sparse_embedding:
+            return np.zeros(len(self.snapshot), dtype=np.float32)
+        q_idx = np.asarray(sorted(sparse_embedding), dtype=np.int64)
+        q_val = np.asarray([sparse_embedding[k] for k in sorted(sparse_embedding)], dtype=np.float32)
+        indices = np.asarray(self.snapshot.sparse_indices, dtype=np.int64)
+        pos = np.clip(np.searchsorted(q_idx, indices), 0, len(q_idx) - 1)
+        contrib = np.where(q_idx[pos] == indices, self.snapshot.sparse_values * q_val[pos], 0)
+        return np.bincount(self._sparse_rows, weights=contrib, minlength=len(self.snapshot))
+
+    @staticmethod
+    def _top(scores, count, mask):
+        # scores 越小越靠前，mask 之外的文本块不参与排序
+        if mask is not None:
+            scores = np.where(mask, scores, np.inf)
+            count = min(count, int(mask.sum()))
+        return topk_smallest(scores, count).tolist()
+
+    def search(self, dense_embedding, sparse_embedding, count=100, top_k=5, file_names=None):
+        mask = self._mask(file_names)
+        rankings = []
+        if dense_embedding is not None:
+            rankings.append(self._top(self.dense_scores(dense_embedding), count, mask))
+        if sparse_embedding is not None:
+            sparse_scores = self.sparse_scores(sparse_embedding)
+            # 与 Milvus 稀疏检索一致，只返回有词项命中的文本块
+            sparse_mask = sparse_scores > 0 if mask is None else mask & (sparse_scores > 0)
+            rankings.append(self._top(-sparse_scores, count, sparse_mask))
+
+        # 与 RRFRanker(count) 相同的融合方式
+        results = []
+        for i, score in rrf_fuse(rankings, count)[:top_k]:
+            results.append({
+                "id": int(self.snapshot.ids[i]),
+                "text": self.snapshot.metadata['text'][i],
+                "file_name": self.snapshot.metadata['file_name'][i],
+                "page_number": self.snapshot.metadata['page_number'][i],
+                "score": score
+            })
+        return results
+
+
+if __name__ == '__main__':
+    from pipeline import singleton_pipeline
+
+    arg_parser = argparse.ArgumentParser(description="导出/导入数据集快照")
+    sub = arg_parser.add_subparsers(dest='command', required=True)
+    export_cmd = sub.add_parser('export', help="将 Milvus 数据集导出为快照")
+    export_cmd.add_argument('collection')
+    export_cmd.add_argument('out_dir')
+    import_cmd = sub.add_parser('import', help="将快照批量导入 Milvus")
+    import_cmd.add_argument('snapshot_dir')
+    import_cmd.add_argument('--collection', default=None, help="目标数据集名，默认使用快照中的名称")
+    args = arg_parser.parse_args()
+
+    if args.command == 'export':
+        singleton_pipeline.export_snapshot(args.collection, args.out_dir)
+    else:
+        singleton_pipeline.import_snapshot(args.snapshot_dir, args.collection)
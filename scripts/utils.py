@@ -2,9 +2,13 @@ import hashlib
 import uuid
 from typing import List, Dict, Union
 
+import numpy as np
 from langchain_text_splitters import RecursiveCharacterTextSplitter
 import os
 
+# text-embedding-v4 稠密向量维度，与 Milvus 集合 schema 一致
+EMBEDDING_DIM = 1024
+
 
 def generate_uuid():
     return str(uuid.uuid4()).replace('-', '')
@@ -14,6 +18,21 @@ def generate_md5(input_string: str) -> str:
     return hashlib.md5(input_string.encode('utf-8')).hexdigest()
 
 
+def generate_file_md5(file_path: str) -> str:
+    md5 = hashlib.md5()
+    with open(file_path, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b''):
+            md5.update(block)
+    return md5.hexdigest()
+
+
+def generate_chunk_id(collection: str, source_md5: str, ordinal: int, text: str) -> int:
+    # 由 (数据集, 文件哈希, 块序号, 文本哈希) 确定性生成主键，重复写入同一文本块时 upsert 覆盖而不会产生重复行
+    key = f"{collection}:{source_md5}:{ordinal}:{generate_md5(text)}"
+    # Milvus INT64 主键，取 md5 前 16 位并保留 63 位确保为正数
+    return int(generate_md5(key)[:16], 16) & 0x7FFFFFFFFFFFFFFF
+
+
 def get_dir_and_file_names(path):
     file_names = []
     dir_name = ""
@@ -113,6 +132,29 @@ def txt_to_chunks(text_content: str, chunk_size: int, chunk_overlap: float, sepa
     return formatted_chunks
 
 
+def rrf_fuse(rankings, k):
+    # 与 RRFRanker(k) 相同的打分方式：score = sum(1 / (k + rank))，rank 从 1 开始
+    scores = {}
+    for ranking in rankings:
+        for rank, key in enumerate(ranking):
+            scores[key] = scores.get(key, 0.0) + 1.0 / (k + rank + 1)
+    return sorted(scores.items(), key=lambda x: x[1], reverse=True)
+
+
+def l2_distances(vectors, sq_norms, query):
+    # 展开为 |x|^2 - 2x·q + |q|^2，向量平方范数预先计算
+    q = np.asarray(query, dtype=np.float32)
+    return sq_norms - 2 * vectors.dot(q) + q.dot(q)
+
+
+def topk_smallest(scores, count):
+    count = min(count, len(scores))
+    if count <= 0:
+        return np.empty(0, dtype=np.int64)
+    top = np.argpartition(scores, count - 1)[:count]
+    return top[np.argsort(scores[top])]
+
+
 if __name__ == '__main__':
     with open('demo.txt', 'r', encoding='utf-8') as f:
         text_content = f.read()
@@ -1,6 +1,9 @@
+import argparse
+import json
 import logging
 import os
 import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 from http import HTTPStatus
 
 import dashscope
@@ -10,20 +13,27 @@ from pymilvus import MilvusClient, FieldSchema, CollectionSchema, DataType, RRFR
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
 try:
-    from utils import json_to_chunks, txt_to_chunks
+    from utils import json_to_chunks, txt_to_chunks, generate_chunk_id, generate_md5, rrf_fuse, EMBEDDING_DIM
     from document_parser import ParsedRecordManager
+    from dense_retriever import COARSE_DIM, NLIST, NPROBE, truncate_embeddings, num_candidates
 except:
-    from utils import json_to_chunks, txt_to_chunks
+    from utils import json_to_chunks, txt_to_chunks, generate_chunk_id, generate_md5, rrf_fuse, EMBEDDING_DIM
     from document_parser import ParsedRecordManager
+    from dense_retriever import COARSE_DIM, NLIST, NPROBE, truncate_embeddings, num_candidates
 
 
 class VectorProcessor:
 
     def __init__(self, milvus_host="127.0.0.1", milvus_port="19530",
                  dashscope_api_key="", drop_collection=[],
-                 record_manager: ParsedRecordManager = None):
+                 record_manager: ParsedRecordManager = None, num_partitions=16):
         self.milvus_client = MilvusClient(host=milvus_host, port=milvus_port)
         self.record_manager = record_manager
+        # file_name 作为分区键，同一文件的文本块落在同一分区，按文件过滤时只扫描相关分区
+        self.num_partitions = num_partitions
+        # collection -> 是否有截断向量字段 embedding_coarse（仅 _create_collection(coarse=True) 创建的集合有）
+        self._coarse_fields = {}
+        self._coarse_warned = set()
         dashscope.api_key = dashscope_api_key
 
         for dcoll in drop_collection:
@@ -35,7 +45,7 @@ class VectorProcessor:
         logging.info(f"当前Milvus中的所有Collection: {collections}")
         logging.info(f"向量数据库启动成功")
 
-    def _create_collection(self, collection_name):
+    def _create_collection(self, collection_name, coarse=False):
         if self.milvus_client.has_collection(collection_name=collection_name):
             logging.info(f"Collection '{collection_name}' already exists.")
             # 如果集合已存在，也需要加载到内存
@@ -44,23 +54,34 @@ class VectorProcessor:
             return
 
         fields = [
-            FieldSchema(name="id", dtype=DataType.INT64, is_primary=True, auto_id=True),
-            FieldSchema(name="embedding", dtype=DataType.FLOAT_VECTOR, dim=1024),
+            # 主键由 generate_chunk_id 确定性生成，重试时 upsert 覆盖同一行
+            FieldSchema(name="id", dtype=DataType.INT64, is_primary=True, auto_id=False),
+            FieldSchema(name="embedding", dtype=DataType.FLOAT_VECTOR, dim=EMBEDDING_DIM),
             FieldSchema(name="text_sparse", dtype=DataType.SPARSE_FLOAT_VECTOR),
             FieldSchema(name="text", dtype=DataType.VARCHAR, max_length=65535),
-            FieldSchema(name="file_name", dtype=DataType.VARCHAR, max_length=256, description="原始文件名"),
+            FieldSchema(name="file_name", dtype=DataType.VARCHAR, max_length=256, description="原始文件名",
+                        is_partition_key=True),
             FieldSchema(name="page_number", dtype=DataType.VARCHAR, max_length=128, description="文本所在页码")
         ]
+        if coarse:
+            # 按集合显式开启：完整向量前 COARSE_DIM 维截断并归一化，用于两阶段稠密检索的粗排。
+            # 真实向量上的召回率未经 bench_dense.py --milvus --snapshot 验证前，默认 schema 不包含该字段
+            fields.insert(2, FieldSchema(name="embedding_coarse", dtype=DataType.FLOAT_VECTOR, dim=COARSE_DIM))
         schema = CollectionSchema(fields, description=f"{collection_name} RAG Collection")
-        self.milvus_client.create_collection(collection_name=collection_name, schema=schema)
+        self.milvus_client.create_collection(collection_name=collection_name, schema=schema,
+                                             num_partitions=self.num_partitions)
         logging.info(f"Collection '{collection_name}' created successfully.")
 
         # 创建索引
         index_params = self.milvus_client.prepare_index_params()
         index_params.add_index(field_name="embedding", index_type="FLAT", metric_type="L2")
+        if coarse:
+            index_params.add_index(field_name="embedding_coarse", index_type="IVF_FLAT", metric_type="IP",
+                                   params={"nlist": NLIST})
         index_params.add_index(field_name="text_sparse", index_type="SPARSE_INVERTED_INDEX",
                                metric_type="IP",
                                params={"inverted_index_algo": "DAAT_MAXSCORE"})
+        index_params.add_index(field_name="file_name", index_type="INVERTED")
         self.milvus_client.create_index(collection_name=collection_name, index_params=index_params)
         logging.info(f"Index created for collection '{collection_name}'.")
 
@@ -68,6 +89,40 @@ class VectorProcessor:
         self.milvus_client.load_collection(collection_name=collection_name)
         logging.info(f"Collection '{collection_name}' loaded into memory.")
 
+    def migrate_scalar_index(self, collection_name):
+        # 一次性迁移：旧集合没有 file_name 标量索引时补建（分区键只能在建表时指定，旧集合需重建才能按分区裁剪）。
+        # 建索引前需释放集合，期间该集合无法检索，请在维护窗口手动执行，入库流程不会自动调用
+        if self.milvus_client.list_indexes(collection_name=collection_name, field_name="file_name"):
+            logging.info(f"Collection '{collection_name}' 已有 file_name 标量索引，无需迁移")
+            return False
+        self.milvus_client.release_collection(collection_name=collection_name)
+        try:
+            index_params = self.milvus_client.prepare_index_params()
+            index_params.add_index(field_name="file_name", index_type="INVERTED")
+            self.milvus_client.create_index(collection_name=collection_name, index_params=index_params)
+            logging.info(f"Scalar index created on 'file_name' for collection '{collection_name}'.")
+        finally:
+            self.milvus_client.load_collection(collection_name=collection_name)
+        return True
+
+    @staticmethod
+    def build_file_filter(file_names):
+        if not file_names:
+            return ""
+        if isinstance(file_names, str):
+            file_names = [file_names]
+        # json.dumps 负责字符串转义，输出即为合法的 Milvus 表达式列表
+        return f"file_name in {json.dumps(list(file_names), ensure_ascii=False)}"
+
+    def delete_file_chunks(self, collection_name, file_name):
+        if not self.milvus_client.has_collection(collection_name=collection_name):
+            return 0
+        res = self.milvus_client.delete(collection_name=collection_name,
+                                        filter=self.build_file_filter([file_name]))
+        delete_count = res.get('delete_count', 0) if isinstance(res, dict) else len(res)
+        logging.info(f"数据集: {collection_name}, 已删除文件 '{file_name}' 的 {delete_count} 个文本块。")
+        return delete_count
+
     def emb_text(self, text, is_query=False):
         resp = dashscope.TextEmbedding.call(
             model="text-embedding-v4",
@@ -87,31 +142,90 @@ class VectorProcessor:
                 f"Error getting embedding for text: {text}. Status code: {resp.status_code}, Message: {resp.message}")
             return None, None
 
-    def save_chunks(self, chunks, file_name, collection_name):
-        entities = []
-        for chunk_item in chunks:
-            chunk_text = chunk_item['text']
-            if chunk_text:
-                page_number = chunk_item['page_number']
-                dense_embedding, sparse_embedding = self.emb_text(chunk_text)  # Get both dense and sparse embeddings
-                if dense_embedding is None or sparse_embedding is None:
-                    logging.warning(f"Skipping chunk due to embedding failure: {chunk_text[:50]}...")
-                    continue
-                entity_data = {
-                    "embedding": dense_embedding,
-                    "text": chunk_text,
-                    "file_name": file_name,
-                    "page_number": ','.join(map(str, page_number)),
-                    "text_sparse": sparse_embedding
-                }
-                entities.append(entity_data)
-
-        if entities:
-            logging.debug(f"Attempting to insert {len(entities)} entities into {collection_name}")
+    def _is_auto_id(self, collection_name):
+        # 旧集合使用 auto_id，无法写入确定性主键，只能退回 insert
+        return self.milvus_client.describe_collection(collection_name=collection_name).get('auto_id', False)
+
+    def _has_coarse_field(self, collection_name):
+        if collection_name not in self._coarse_fields:
+            fields = self.milvus_client.describe_collection(collection_name=collection_name).get('fields', [])
+            self._coarse_fields[collection_name] = any(f.get('name') == 'embedding_coarse' for f in fields)
+        return self._coarse_fields[collection_name]
+
+    def _add_coarse_embeddings(self, collection_name, entities):
+        if not self._has_coarse_field(collection_name):
+            return
+        coarse = truncate_embeddings([entity['embedding'] for entity in entities])
+        for entity, vec in zip(entities, coarse):
+            entity['embedding_coarse'] = vec.tolist()
+
+    def upsert_entities(self, collection_name, entities):
+        self._add_coarse_embeddings(collection_name, entities)
+        self.milvus_client.upsert(collection_name=collection_name, data=entities)
+        return [entity['id'] for entity in entities]
+
+    def _write_entities(self, collection_name, entities, auto_id):
+        if auto_id:
+            for entity in entities:
+                entity.pop('id', None)
+            self._add_coarse_embeddings(collection_name, entities)
             res = self.milvus_client.insert(collection_name=collection_name, data=entities)
-            logging.info(f"Inserted {len(res['ids'])} documents into Milvus collection {collection_name}.")
-            return res['ids']
-        return []
+            return list(res['ids'])
+        return self.upsert_entities(collection_name, entities)
+
+    def save_chunks(self, chunks, file_name, collection_name, source_md5="", start=0, batch_size=1,
+                    on_checkpoint=None):
+        # 默认每个文本块写入后立即记录断点，中断后不会重复调用向量模型；batch_size > 1 时以批为单位落盘
+        auto_id = self._is_auto_id(collection_name)
+        if auto_id:
+            logging.warning(f"Collection '{collection_name}' 使用 auto_id，重试可能产生重复数据，建议重建集合。")
+
+        ids = []
+        pending = []
+        next_chunk = start
+        checkpointed = start
+
+        def flush():
+            nonlocal pending, checkpointed
+            if pending:
+                ids.extend(self._write_entities(collection_name, pending, auto_id))
+                pending = []
+            if on_checkpoint and next_chunk != checkpointed:
+                on_checkpoint(next_chunk)
+            checkpointed = next_chunk
+
+        try:
+            for ordinal in range(start, len(chunks)):
+                chunk_item = chunks[ordinal]
+                chunk_text = chunk_item['text']
+                if chunk_text:
+                    page_number = chunk_item['page_number']
+                    dense_embedding, sparse_embedding = self.emb_text(chunk_text)  # Get both dense and sparse embeddings
+                    if dense_embedding is None or sparse_embedding is None:
+                        # 向量化失败（如限流）时停止，断点停在该块，下次从这里继续
+                        logging.warning(f"Embedding failed at chunk {ordinal}, stopping: {chunk_text[:50]}...")
+                        break
+                    pending.append({
+                        "id": generate_chunk_id(collection_name, source_md5, ordinal, chunk_text),
+                        "embedding": dense_embedding,
+                        "text": chunk_text,
+                        "file_name": file_name,
+                        "page_number": ','.join(map(str, page_number)),
+                        "text_sparse": sparse_embedding
+                    })
+                next_chunk = ordinal + 1
+                if len(pending) >= batch_size:
+                    flush()
+        except BaseException:
+            # 异常退出（包括中断）时也把已向量化的文本块写入并记录断点；写入本身失败时断点保持不变
+            try:
+                flush()
+            except Exception as e:
+                logging.error(f"写入 {collection_name} 失败，断点停在第 {checkpointed} 个文本块: {e}")
+            raise
+        flush()
+        logging.info(f"Upserted {len(ids)} documents into Milvus collection {collection_name}.")
+        return ids, checkpointed
 
     def vectorize_parsed_documents(self, chunk_size: int = 500, chunk_overlap_percent: float = 0.1) -> list:
         results = []
@@ -129,6 +243,7 @@ class VectorProcessor:
 
             result = dict()
             result['name'] = ori_filename
+            result['collection'] = coll_name
             result['inserted_ids'] = []
 
             logging.info(f"数据集: {coll_name}, 文件: {parsed_filename}, 原文件: {ori_filename} 正在向量化......")
@@ -152,18 +267,65 @@ class VectorProcessor:
                 logging.warning(f"不支持的文件类型: {parsed_filename}")
                 continue
 
-            inserted_ids = self.save_chunks(chunks, ori_filename, coll_name)
+            # 断点续传：解析内容和分块参数未变时，从上次写入的块之后继续；否则清理旧数据重新开始
+            content_md5 = generate_md5(file_content if isinstance(file_content, str)
+                                       else json.dumps(file_content, sort_keys=True, ensure_ascii=False))
+            checkpoint = self.record_manager.record_checkpoint(record)
+            start = 0
+            if (checkpoint.get('content_md5') == content_md5 and checkpoint.get('chunk_size') == chunk_size
+                    and checkpoint.get('chunk_overlap_percent') == chunk_overlap_percent):
+                start = checkpoint.get('next_chunk', 0)
+                logging.info(f"文件 {parsed_filename} 从第 {start}/{len(chunks)} 个文本块继续向量化")
+            else:
+                # 清理该文件此前残留的行（旧版本中途失败写入的数据或已变更的内容）
+                self.delete_file_chunks(coll_name, ori_filename)
+
+            inserted_ids, next_chunk = self.save_chunks(
+                chunks, ori_filename, coll_name, source_md5=content_md5, start=start,
+                on_checkpoint=lambda n: self.record_manager.record_update_checkpoint(
+                    record, content_md5, chunk_size, chunk_overlap_percent, n))
             result['inserted_ids'].extend(inserted_ids)
 
             result['size'] = len(result['inserted_ids'])
-            logging.info(f"数据集: {coll_name}, 文件 '{parsed_filename}' 处理完成，共插入 {result['size']} 个文本块。")
+            if next_chunk < len(chunks):
+                logging.warning(f"数据集: {coll_name}, 文件 '{parsed_filename}' 向量化中断于第 {next_chunk} 个文本块，下次运行将继续。")
+                results.append(result)
+                continue
+            logging.info(f"数据集: {coll_name}, 文件 '{parsed_filename}' 处理完成，共写入 {result['size']} 个文本块。")
             self.record_manager.record_update_status_embed(record)
             results.append(result)
         return results
 
-    def search_hybrid(self, collection_name, query, count=100, top_k=5):
+    def search_hybrid(self, collection_name, query, count=100, top_k=5, file_names=None, query_embedding=None,
+                      collection_timeout=5.0, adaptive=False, initial_count=20, dense_mode="flat", skipped=None):
+        # skipped: 传入列表时，检索超时或失败（结果不完整）的数据集名会追加到其中，供调用方提示用户
         t0 = time.time()
-        dense_embedding, sparse_embedding = self.emb_text(query)
+        # 调用方已计算过问题向量时（如答案缓存需要用到），直接复用，避免重复调用向量模型
+        if query_embedding is not None:
+            dense_embedding, sparse_embedding = query_embedding
+        else:
+            dense_embedding, sparse_embedding = self.emb_text(query)
+        # 按文件过滤，file_name 为分区键，过滤后只检索相关分区
+        expr = self.build_file_filter(file_names)
+        # 召回数不超过初始候选池两倍时，逐步扩大最多省一轮，不如一次取满
+        if adaptive and count <= 2 * self._initial_pool(count, top_k, initial_count):
+            adaptive = False
+
+        if not isinstance(collection_name, str):
+            collections = list(collection_name)
+            if not collections:
+                logging.warning("未选择数据集，无法检索")
+                return []
+            if len(collections) > 1 or adaptive or dense_mode != "flat":
+                return self._search_fused(collections, query, dense_embedding, sparse_embedding, count, top_k,
+                                          expr, collection_timeout, t0, adaptive, initial_count, dense_mode,
+                                          skipped)
+            collection_name = collections[0]
+        elif adaptive or dense_mode != "flat":
+            # 自适应召回和两阶段稠密检索都需要在客户端融合，不走 Milvus hybrid_search
+            return self._search_fused([collection_name], query, dense_embedding, sparse_embedding, count, top_k,
+                                      expr, collection_timeout, t0, adaptive, initial_count, dense_mode, skipped)
+
         reqs = []
 
         if dense_embedding is not None:
@@ -171,7 +333,8 @@ class VectorProcessor:
                 "data": [dense_embedding],
                 "anns_field": "embedding",
                 "param": {"nprobe": 10},
-                "limit": count
+                "limit": count,
+                "expr": expr or None
             }
             query_emb_req = AnnSearchRequest(**query_embedding_params)
             reqs.append(query_emb_req)
@@ -180,7 +343,8 @@ class VectorProcessor:
                 "data": [sparse_embedding],
                 "anns_field": "text_sparse",
                 "param": {"nprobe": 10},
-                "limit": count
+                "limit": count,
+                "expr": expr or None
             }
             query_text_req = AnnSearchRequest(**query_text_params)
             reqs.append(query_text_req)
@@ -200,6 +364,9 @@ class VectorProcessor:
             output_fields=["id", "text", "file_name", "page_number"]
         )
         t1 = time.time()
+        if not search_result[0]:
+            logging.info(f"检索到的文档: 0 个，耗时: {t1 - t0:.2f} 秒，过滤条件：{expr}")
+            return []
         logging.info(
             f"检索到的文档: {len(search_result[0])} 个，耗时: {t1 - t0:.2f} 秒，最高分：{search_result[0][0]['distance']}，最低分：{search_result[0][-1]['distance']}")
         results = []
@@ -209,8 +376,212 @@ class VectorProcessor:
             results.append(entity)
         return results
 
+    def _search_dense_two_stage(self, collection_name, dense_embedding, count, expr, timeout):
+        # 第一阶段：在截断的低维向量（IVF_FLAT）上粗排，只取较宽候选集的 id；
+        # 第二阶段：限定候选 id，在完整向量（FLAT 索引）上精确计算 L2，完整向量不需要传回客户端
+        coarse_query = truncate_embeddings(dense_embedding).tolist()
+        candidates = self.milvus_client.search(
+            collection_name=collection_name, data=[coarse_query], anns_field="embedding_coarse",
+            limit=num_candidates(count), filter=expr, search_params={"metric_type": "IP", "params": {"nprobe": NPROBE}},
+            output_fields=[], timeout=timeout)[0]
+        if not candidates:
+            return []
+        id_filter = f"id in {[hit['id'] for hit in candidates]}"
+        if expr:
+            # 保留文件过滤条件，按分区键裁剪
+            id_filter = f"({expr}) and {id_filter}"
+        return self.milvus_client.search(
+            collection_name=collection_name, data=[dense_embedding], anns_field="embedding", limit=count,
+            filter=id_filter, search_params={"metric_type": "L2", "params": {}},
+            output_fields=[], timeout=timeout)[0]
+
+    def _search_leg(self, collection_name, leg, dense_embedding, sparse_embedding, count, expr, timeout,
+                    dense_mode="flat", offset=0):
+        # 单个数据集的一路检索（dense / sparse），只取名次 [offset, count) 的 id 和距离，
+        # 文本等字段留到最终 top_k 确定后再取
+        if leg == 'dense':
+            if dense_mode == "two_stage":
+                if self._has_coarse_field(collection_name):
+                    return self._search_dense_two_stage(collection_name, dense_embedding, count, expr,
+                                                        timeout)[offset:]
+                if collection_name not in self._coarse_warned:
+                    self._coarse_warned.add(collection_name)
+                    logging.warning(f"Collection '{collection_name}' 没有 embedding_coarse 字段，两阶段稠密检索退回 FLAT。")
+            return self.milvus_client.search(
+                collection_name=collection_name, data=[dense_embedding], anns_field="embedding",
+                limit=count - offset, filter=expr,
+                search_params={"metric_type": "L2", "params": {"nprobe": 10}, "offset": offset},
+                output_fields=[], timeout=timeout)[0]
+        return self.milvus_client.search(
+            collection_name=collection_name, data=[sparse_embedding], anns_field="text_sparse",
+            limit=count - offset, filter=expr, search_params={"metric_type": "IP", "params": {}, "offset": offset},
+            output_fields=[], timeout=timeout)[0]
+
+    @staticmethod
+    def _legs_of(dense_embedding, sparse_embedding):
+        legs = []
+        if dense_embedding is not None:
+            legs.append('dense')
+        if sparse_embedding is not None:
+            legs.append('sparse')
+        return legs
+
+    def _search_legs(self, collection_name, dense_embedding, sparse_embedding, count, expr, timeout,
+                     dense_mode="flat"):
+        # 顺序执行单个数据集的各路检索，供基准测试等单线程场景使用
+        return {leg: self._search_leg(collection_name, leg, dense_embedding, sparse_embedding, count, expr,
+                                      timeout, dense_mode)
+                for leg in self._legs_of(dense_embedding, sparse_embedding)}
+
+    def _gather_legs(self, tasks, dense_embedding, sparse_embedding, offset, pool, expr, collection_timeout,
+                     dense_mode, hits):
+        # tasks 为 (数据集, dense/sparse) 列表，全部并发执行，每路只取名次 [offset, pool) 这一段并追加到 hits，
+        # 扩大候选池时不重复检索已取回的部分。每次调用使用独立线程池，线程数等于任务数，
+        # 任务提交后立即开始，不会排在其他请求后面；超时从任务真正开始执行时计算。
+        # 返回超时或失败的 (数据集, 路) 集合，调用方跳过这些结果并告知用户。
+        started = {}
+
+        def run(coll, leg):
+            started[(coll, leg)] = time.time()
+            return self._search_leg(coll, leg, dense_embedding, sparse_embedding, pool, expr, collection_timeout,
+                                    dense_mode, offset)
+
+        executor = ThreadPoolExecutor(max_workers=max(len(tasks), 1))
+        futures = {executor.submit(run, coll, leg): (coll, leg) for coll, leg in tasks}
+        pending = set(futures)
+        timed_out = []
+        try:
+            while pending:
+                now = time.time()
+                deadlines = {f: started.get(futures[f], now) + collection_timeout for f in pending}
+                for future, deadline in deadlines.items():
+                    if deadline <= now:
+                        pending.discard(future)
+                        timed_out.append(future)
+                if not pending:
+                    break
+                _, pending = wait(pending, timeout=min(deadlines[f] for f in pending) - now,
+                                  return_when=FIRST_COMPLETED)
+        finally:
+            # 未开始的任务直接取消；已开始的任务由 Milvus 客户端超时自行结束，不阻塞本次请求
+            executor.shutdown(wait=False, cancel_futures=True)
+
+        failed = set()
+        for future in timed_out:
+            coll, leg = futures[future]
+            logging.warning(f"数据集 {coll} {leg} 检索超时（{collection_timeout} 秒），已跳过")
+            failed.add((coll, leg))
+
+        for future, (coll, leg) in futures.items():
+            if future in timed_out:
+                continue
+            try:
+                hits.setdefault((coll, leg), []).extend(future.result())
+            except Exception as e:
+                logging.error(f"数据集 {coll} {leg} 检索失败: {e}")
+                failed.add((coll, leg))
+        return failed
+
+    @staticmethod
+    def _rank_hits(hits, pool):
+        # 同一向量模型下各数据集的距离可比，先按稠密、稀疏分别做全局排序，再用 RRF 融合
+        dense_hits, sparse_hits = [], []
+        for (coll, leg), leg_hits in hits.items():
+            target = dense_hits if leg == 'dense' else sparse_hits
+            target.extend(((coll, hit['id']), hit['distance']) for hit in leg_hits)
+        dense_hits.sort(key=lambda x: x[1])
+        sparse_hits.sort(key=lambda x: x[1], reverse=True)
+        return [[key for key, _ in leg_hits[:pool]] for leg_hits in (dense_hits, sparse_hits) if leg_hits]
+
+    @staticmethod
+    def _ranking_settled(fused, rankings, top_k, k, pool, stable):
+        # 严格条件：未进入候选池的文本块在每路排序中的名次都大于 pool，RRF 得分上限为 n_legs / (k + pool + 1)；
+        # 已召回的文本块最多再从另一路获得 1 / (k + pool + 1)。k = count 时各名次得分差很小，严格条件很少成立，
+        # 因此另加两个近似条件：前 top_k 个结果同时出现在每一路的候选池中（两路结果一致，更深的候选很难挤进 top_k），
+        # 或扩大候选池后 top_k 不变。
+        if len(fused) < top_k:
+            return False
+        top = [key for key, _ in fused[:top_k]]
+        if len(rankings) > 1 and all(set(top) <= set(ranking) for ranking in rankings):
+            return True
+        if stable:
+            return True
+        bound = 1.0 / (k + pool + 1)
+        kth_score = fused[top_k - 1][1]
+        next_score = fused[top_k][1] if len(fused) > top_k else 0.0
+        return kth_score >= len(rankings) * bound and kth_score - next_score >= bound
+
+    @staticmethod
+    def _initial_pool(count, top_k, initial_count):
+        return min(max(initial_count, top_k * 2), count)
+
+    def _fetch_entities(self, keys):
+        # 只为最终 top_k 取回 text 等大字段
+        by_collection = {}
+        for coll, pk in keys:
+            by_collection.setdefault(coll, []).append(pk)
+        entities = {}
+        for coll, ids in by_collection.items():
+            rows = self.milvus_client.get(collection_name=coll, ids=ids,
+                                          output_fields=["id", "text", "file_name", "page_number"])
+            for row in rows:
+                entities[(coll, row['id'])] = dict(row, collection=coll)
+        return entities
+
+    def _search_fused(self, collections, query, dense_embedding, sparse_embedding, count, top_k, expr,
+                      collection_timeout, t0, adaptive=False, initial_count=20, dense_mode="flat", skipped=None):
+        if dense_embedding is None and sparse_embedding is None:
+            logging.error(f"Error: No valid embedding generated for query: '{query}'. Cannot perform search.")
+            return []
+
+        # 自适应模式从较小的候选池开始，排序未稳定时翻倍扩大，最多扩到 count；
+        # 每轮只检索新增的名次区间，已取回的结果保留
+        pool = self._initial_pool(count, top_k, initial_count) if adaptive else count
+        tasks = [(coll, leg) for coll in collections for leg in self._legs_of(dense_embedding, sparse_embedding)]
+        hits = {}
+        failed = set()
+        offset, rounds, prev_top = 0, 0, None
+        while True:
+            failed |= self._gather_legs([task for task in tasks if task not in failed], dense_embedding,
+                                        sparse_embedding, offset, pool, expr, collection_timeout, dense_mode, hits)
+            rounds += 1
+            rankings = self._rank_hits(hits, pool)
+            # k 固定为 count，与 RRFRanker(count) 得分一致，不随候选池变化
+            fused = rrf_fuse(rankings, count)
+            top = [key for key, _ in fused[:top_k]]
+            exhausted = all(len(hits.get(task, [])) < pool for task in tasks if task not in failed)
+            if (not adaptive or pool >= count or exhausted
+                    or self._ranking_settled(fused, rankings, top_k, count, pool, top == prev_top)):
+                break
+            prev_top = top
+            offset, pool = pool, min(pool * 2, count)
+
+        entities = self._fetch_entities(top)
+        results = []
+        for key, score in fused[:top_k]:
+            if key not in entities:
+                continue
+            entity = entities[key]
+            entity['score'] = score
+            results.append(entity)
+        skipped_colls = {coll for coll, _ in failed}
+        if skipped is not None:
+            skipped.extend(coll for coll in collections if coll in skipped_colls)
+        t1 = time.time()
+        logging.info(f"融合检索 {len(collections) - len(skipped_colls)}/{len(collections)} 个数据集，候选池: {pool}，"
+                     f"轮数: {rounds}，检索到的文档: {len(results)} 个，耗时: {t1 - t0:.2f} 秒")
+        return results
 
 if __name__ == '__main__':
+    arg_parser = argparse.ArgumentParser(description="向量化解析后的文档")
+    arg_parser.add_argument('--migrate-scalar-index', nargs='+', metavar='COLLECTION', default=None,
+                            help="为旧集合补建 file_name 标量索引（会短暂释放集合），不执行向量化")
+    args = arg_parser.parse_args()
+
     vector = VectorProcessor(dashscope_api_key='YOUR_KEY')
-    vector.vectorize_parsed_documents()
+    if args.migrate_scalar_index:
+        for coll in args.migrate_scalar_index:
+            vector.migrate_scalar_index(coll)
+    else:
+        vector.vectorize_parsed_documents()
 
@@ -2,9 +2,8 @@ import logging
 import time
 
 import streamlit as st
-from qwen_agent.agents import Assistant  # TODO 更换agent
-
 from scripts.pipeline import singleton_pipeline
+from scripts.rag_agent import build_rag_agent
 
 # Streamlit App Initialization
 st.title("🤖 Lobar Law  RAG")
@@ -35,12 +34,16 @@ if 'use_web_search' not in st.session_state:
     st.session_state.use_web_search = False
 if 'embedding' not in st.session_state:
     st.session_state.embedding = "text-embedding-v4"
-if 'dataset' not in st.session_state:
-    st.session_state.dataset = local_dataset("")[0]['name']
+if 'datasets' not in st.session_state:
+    st.session_state.datasets = [local_dataset("")[0]['name']]
 if 'recalls' not in st.session_state:
     st.session_state.recalls = 50
 if 'topk' not in st.session_state:
     st.session_state.topk = 10
+if 'adaptive_recall' not in st.session_state:
+    st.session_state.adaptive_recall = False
+if 'file_scope' not in st.session_state:
+    st.session_state.file_scope = []
 
 # Sidebar Configuration
 st.sidebar.header("⚙️ 设置")
@@ -58,9 +61,14 @@ st.session_state.embedding = st.sidebar.radio(
     "向量模型",
     options=["text-embedding-v4", "text-embedding-v3"],
 )
-st.session_state.dataset = st.sidebar.radio(
-    "数据集(Milvus)",
+st.session_state.datasets = st.sidebar.multiselect(
+    "数据集(Milvus，可多选联合检索)",
     options=[item['name'] for item in local_dataset("")],
+    default=st.session_state.datasets,
+)
+st.session_state.file_scope = st.sidebar.multiselect(
+    "法律范围(不选则检索全部)",
+    options=singleton_pipeline.list_files([local_dataset(name)['collection'] for name in st.session_state.datasets]),
 )
 st.session_state.recalls = st.sidebar.slider(
     "召回数(关键词、向量检索)",
@@ -74,6 +82,10 @@ st.session_state.topk = st.sidebar.slider(
     max_value=50,
     value=10,
 )
+st.session_state.adaptive_recall = st.sidebar.toggle(
+    "自适应召回(召回数作为上限)",
+    value=st.session_state.adaptive_recall,
+)
 
 # Clear Chat Button
 if st.sidebar.button("✨ 清除问答"):
@@ -82,56 +94,8 @@ if st.sidebar.button("✨ 清除问答"):
 
 
 def get_qwen_agent(ref_docs):
-    try:
-        if st.session_state.use_web_search:
-            use_web_prompt = "使用 Tavily MCP 搜索相关内容"
-        else:
-            use_web_prompt = "不使用 Tavily MCP 搜索相关内容"
-        # ====== 助手 system prompt 和函数描述 ======
-        system_prompt = """请充分理解以下参考资料内容，组织出满足用户提问的条理清晰的回复。
-{}
-
-# 参考资料：(文档的相关度作为参考的权重)
-{}""".format(use_web_prompt, ref_docs)
-        # TODO BUG
-        # functions_desc = [
-        #     {"mcpServers": {
-        #         "Tavily": {
-        #             "command": "npx",
-        #             "args": [
-        #                 "-y",
-        #                 "tavily-mcp@0.1.4"
-        #             ],
-        #             "env": {
-        #                 "TAVILY_API_KEY": st.session_state.travily_key
-        #             }
-        #         }
-        #     }}
-        # ]
-        functions_desc = []
-        llm_cfg = {
-            # 使用 DashScope 提供的模型服务
-            'model': st.session_state.model_version,
-            'model_server': 'dashscope',
-            'api_key': st.session_state.model_api_key,
-            'timeout': 30,
-            'retry_count': 3,
-            'generate_cfg': {
-                'top_p': 0.1
-            }
-        }
-        bot = Assistant(
-            llm=llm_cfg,
-            name='RAG检索助手',
-            description='用户提出问题，根据从知识库中检索的某个相关细节来回答。',
-            system_message=system_prompt,
-            function_list=functions_desc,
-        )
-        logging.info("创建助手成功")
-        return bot
-    except Exception as e:
-        logging.error(f"创建助手失败: {str(e)}")
-        raise
+    return build_rag_agent(st.session_state.model_version, st.session_state.model_api_key, ref_docs,
+                           use_web_search=st.session_state.use_web_search)
 
 
 chat_col, toggle_col = st.columns([0.9, 0.1])
@@ -149,15 +113,24 @@ if prompt:
         st.write(prompt)
     logging.info(f"recall/topk: {st.session_state.recalls}, {st.session_state.topk}")
     # Existing RAG flow remains unchanged
+    search_results, query_embedding = [], (None, None)
+    coll_name = [local_dataset(name)['collection'] for name in st.session_state.datasets]
     with st.spinner("🔍 Searching"):
         try:
             rewritten_query = prompt
             t0 = time.time()
-            coll_name = local_dataset(st.session_state.dataset)['collection']
+            skipped_colls = []
+            query_embedding = singleton_pipeline.embed_query(rewritten_query)
             search_results = singleton_pipeline.search(coll_name, rewritten_query,
+                                                       query_embedding=query_embedding,
+                                                       file_names=st.session_state.file_scope,
                                                        count=st.session_state.recalls,
-                                                       top_k=st.session_state.topk)
+                                                       adaptive=st.session_state.adaptive_recall,
+                                                       top_k=st.session_state.topk,
+                                                       skipped=skipped_colls)
             t1 = time.time()
+            if skipped_colls:
+                st.warning(f"以下数据集检索超时或失败，结果可能不完整: {', '.join(skipped_colls)}")
             with st.expander(f"检索结果： 查询到 {len(search_results)} 个文档，耗时: {t1 - t0:.2f} 秒"):
                 with st.chat_message("user"):
                     st.markdown(
@@ -166,6 +139,18 @@ if prompt:
             st.error(f"❌ Error query: {str(e)}")
             rewritten_query = ""
 
+    # 语义答案缓存：相似问题且检索结果一致时直接返回已有回答，不再调用大模型
+    chunk_ids = [r['id'] for r in search_results]
+    cached_answer = None
+    if chunk_ids:
+        cached_answer = singleton_pipeline.answer_cache.lookup(coll_name, st.session_state.model_version,
+                                                               query_embedding[0], chunk_ids)
+    if cached_answer:
+        with st.chat_message("assistant"):
+            st.markdown(cached_answer)
+            st.caption("⚡ 来自答案缓存")
+        st.stop()
+
     try:
         with st.spinner("🤔Thinking..."):
             bot = get_qwen_agent(singleton_pipeline.format_search_results(search_results))
@@ -182,6 +167,9 @@ if prompt:
                         full_response = resp_json['content']
                         message_placeholder.markdown(full_response + "▌")
                 message_placeholder.markdown(full_response)
+            if chunk_ids:
+                singleton_pipeline.answer_cache.put(coll_name, st.session_state.model_version, rewritten_query,
+                                                    query_embedding[0], chunk_ids, full_response)
     except Exception as e:
         st.error(f"❌ Error Agent: {str(e)}")
 
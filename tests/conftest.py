@@ -0,0 +1,5 @@
+import os
+import sys
+
+# scripts 下的模块使用同目录导入（如 from utils import ...），测试时与直接运行脚本一样加入搜索路径
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'scripts'))
@@ -0,0 +1,152 @@
+import json
+import os
+
+import pytest
+
+pytest.importorskip("pymilvus")
+pytest.importorskip("dashscope")
+pytest.importorskip("langchain_text_splitters")
+
+from document_parser import ParsedRecordManager
+from utils import generate_chunk_id
+from vector_processor import VectorProcessor
+
+COLLECTION = 'labor_law'
+
+
+class FakeMilvusClient:
+    # 只保存 upsert 的行，断点续传不依赖真实 Milvus
+    def __init__(self):
+        self.rows = {}
+
+    def has_collection(self, collection_name):
+        return True
+
+    def load_collection(self, collection_name):
+        pass
+
+    def describe_collection(self, collection_name):
+        return {'auto_id': False, 'fields': [{'name': 'id'}, {'name': 'embedding'}, {'name': 'text_sparse'}]}
+
+    def upsert(self, collection_name, data):
+        for row in data:
+            self.rows[row['id']] = row
+
+    def delete(self, collection_name, filter):
+        file_names = json.loads(filter[len('file_name in '):])
+        ids = [pk for pk, row in self.rows.items() if row['file_name'] in file_names]
+        for pk in ids:
+            del self.rows[pk]
+        return {'delete_count': len(ids)}
+
+
+class Killed(BaseException):
+    pass
+
+
+def make_processor(client, output_dir, kill_after=None):
+    # 每次重新从磁盘加载解析记录，相当于进程被杀后重新启动
+    processor = VectorProcessor.__new__(VectorProcessor)
+    processor.milvus_client = client
+    processor.record_manager = ParsedRecordManager(output_dir, 'parsed_records.json')
+    processor._coarse_fields = {}
+    processor._coarse_warned = set()
+    processor.embed_calls = []
+
+    def emb_text(text, is_query=False):
+        if kill_after is not None and len(processor.embed_calls) >= kill_after:
+            raise Killed()
+        processor.embed_calls.append(text)
+        return [0.1] * 1024, {1: 0.5}
+
+    processor.emb_text = emb_text
+    return processor
+
+
+@pytest.fixture
+def parsed_dir(tmp_path):
+    text = "\n\n".join(f"第{i}条 " + "劳动者享有平等就业和选择职业的权利。" * 20 for i in range(12))
+    (tmp_path / 'doc.txt').write_text(text, encoding='utf-8')
+    records = [{'filename': 'doc.txt', 'original_filename': '劳动法.txt', 'collection': COLLECTION}]
+    (tmp_path / 'parsed_records.json').write_text(json.dumps(records), encoding='utf-8')
+    return str(tmp_path)
+
+
+def test_resume_after_kill(parsed_dir, tmp_path_factory):
+    # 不中断的完整运行作为对照
+    clean_dir = str(tmp_path_factory.mktemp('clean'))
+    for name in ('doc.txt', 'parsed_records.json'):
+        with open(os.path.join(parsed_dir, name), 'rb') as src, open(os.path.join(clean_dir, name), 'wb') as dst:
+            dst.write(src.read())
+    clean_client = FakeMilvusClient()
+    clean = make_processor(clean_client, clean_dir)
+    clean.vectorize_parsed_documents()
+    total = len(clean.embed_calls)
+    assert total > 4
+
+    client = FakeMilvusClient()
+    first = make_processor(client, parsed_dir, kill_after=3)
+    with pytest.raises(Killed):
+        first.vectorize_parsed_documents()
+    assert len(client.rows) == 3
+    checkpoint = ParsedRecordManager(parsed_dir, 'parsed_records.json').records[0]['checkpoint']
+    assert checkpoint['next_chunk'] == 3
+    assert checkpoint['chunk_overlap_percent'] == 0.1
+
+    second = make_processor(client, parsed_dir)
+    second.vectorize_parsed_documents()
+    # 已写入的文本块不会再次向量化，主键与不中断时完全一致
+    assert len(second.embed_calls) == total - 3
+    assert second.embed_calls == clean.embed_calls[3:]
+    assert set(client.rows) == set(clean_client.rows)
+    record = ParsedRecordManager(parsed_dir, 'parsed_records.json').records[0]
+    assert record['status'] == 'embed'
+    assert record['checkpoint']['next_chunk'] == total
+
+
+def test_changed_chunking_restarts(parsed_dir):
+    client = FakeMilvusClient()
+    with pytest.raises(Killed):
+        make_processor(client, parsed_dir, kill_after=2).vectorize_parsed_documents()
+    # 分块参数变化时不能沿用断点，旧行被清理后重新写入
+    processor = make_processor(client, parsed_dir)
+    processor.vectorize_parsed_documents(chunk_overlap_percent=0.2)
+    assert len(processor.embed_calls) == len(client.rows)
+
+
+def test_save_chunks_checkpoints_every_chunk():
+    processor = make_processor(FakeMilvusClient(), '.', kill_after=4)
+    chunks = [{'text': f'chunk {i}', 'page_number': [1]} for i in range(6)]
+    checkpoints = []
+    with pytest.raises(Killed):
+        processor.save_chunks(chunks, 'a.txt', COLLECTION, source_md5='md5', start=1,
+                              on_checkpoint=checkpoints.append)
+    assert checkpoints == [2, 3, 4, 5]
+    assert set(processor.milvus_client.rows) == {generate_chunk_id(COLLECTION, 'md5', i, f'chunk {i}')
+                                                 for i in range(1, 5)}
+
+
+def test_chunk_id_stable():
+    chunk_id = generate_chunk_id(COLLECTION, 'md5', 3, '文本')
+    assert chunk_id == generate_chunk_id(COLLECTION, 'md5', 3, '文本')
+    assert 0 <= chunk_id < 2 ** 63
+    assert chunk_id != generate_chunk_id(COLLECTION, 'md5', 4, '文本')
+    assert chunk_id != generate_chunk_id(COLLECTION, 'other', 3, '文本')
+
+
+def test_save_records_is_atomic(parsed_dir, monkeypatch):
+    manager = ParsedRecordManager(parsed_dir, 'parsed_records.json')
+    manager.records[0]['status'] = 'embed'
+    manager.save_records()
+
+    def killed_dump(*args, **kwargs):
+        args[1].write('[{"filename": "doc')
+        raise Killed()
+
+    monkeypatch.setattr(json, 'dump', killed_dump)
+    manager.records[0]['checkpoint'] = {'next_chunk': 1}
+    with pytest.raises(Killed):
+        manager.save_records()
+    monkeypatch.undo()
+    # 写入中途被杀时原文件保持完整
+    assert ParsedRecordManager(parsed_dir, 'parsed_records.json').records[0]['status'] == 'embed'
@@ -0,0 +1,73 @@
+import pytest
+
+np = pytest.importorskip("numpy")
+pytest.importorskip("langchain_text_splitters")
+
+from snapshot import LocalIndex, Snapshot, export_collection
+
+DIM = 8
+
+
+class FakeIterator:
+    def __init__(self, rows, batch_size):
+        self.batches = [rows[i:i + batch_size] for i in range(0, len(rows), batch_size)]
+
+    def next(self):
+        return self.batches.pop(0) if self.batches else []
+
+    def close(self):
+        pass
+
+
+class FakeMilvusClient:
+    def __init__(self, rows):
+        self.rows = rows
+
+    def load_collection(self, collection_name):
+        pass
+
+    def query_iterator(self, collection_name, batch_size, filter, output_fields):
+        return FakeIterator(self.rows, batch_size)
+
+
+class FakeVector:
+    def __init__(self, rows):
+        self.milvus_client = FakeMilvusClient(rows)
+        self.record_manager = None
+
+
+def make_rows(n):
+    rng = np.random.default_rng(0)
+    return [{
+        'id': 1000 + i,
+        'embedding': rng.standard_normal(DIM).tolist(),
+        'text_sparse': {i % 5: 1.0, 7: 0.5} if i % 3 else {},
+        'text': f'text {i}',
+        'file_name': f'f{i % 2}',
+        'page_number': '1'
+    } for i in range(n)]
+
+
+def test_export_roundtrip(tmp_path):
+    rows = make_rows(25)
+    manifest = export_collection(FakeVector(rows), 'labor_law', str(tmp_path), batch_size=7)
+    assert manifest['count'] == 25 and manifest['dim'] == DIM
+    assert not list(tmp_path.glob('*.raw'))
+
+    snapshot = Snapshot(str(tmp_path))
+    assert snapshot.ids.tolist() == [row['id'] for row in rows]
+    np.testing.assert_allclose(snapshot.dense, np.asarray([row['embedding'] for row in rows], dtype=np.float32))
+    for i, row in enumerate(rows):
+        assert snapshot.sparse_row(i) == {k: pytest.approx(v) for k, v in row['text_sparse'].items()}
+    assert snapshot.entity(3)['text'] == 'text 3'
+
+    results = LocalIndex(str(tmp_path)).search(rows[4]['embedding'], {4: 1.0}, count=10, top_k=3)
+    assert results[0]['id'] == rows[4]['id']
+
+
+def test_export_rejects_unknown_sparse_format(tmp_path):
+    rows = make_rows(3)
+    rows[1]['text_sparse'] = b'\x00\x01'
+    with pytest.raises(ValueError):
+        export_collection(FakeVector(rows), 'labor_law', str(tmp_path))
+    assert not list(tmp_path.iterdir())